@@ -0,0 +1,119 @@
+from settings import *
+from collections import OrderedDict
+from threading import Lock
+from levels import load_level_data
+from support import FrameSet
+from parallax import LAYERS, layer_height, load_layer
+
+# frame sets each name in a level's 'Entities' layer needs
+ENTITY_FRAMES = {
+    'Player': ('player', 'bullet', 'fire'),
+    'Worm': ('worm',),
+    'Coin': ('coin',),
+    'Health_Potion': ('health_potion',),
+    'Diamond': ('diamond',),
+    'Trader': ('trader',),
+}
+ALWAYS_FRAMES = ('bee',) # spawned by a timer in every level
+
+def surface_bytes(surf):
+    # subsurfaces share their parent's pixels
+    if surf.get_parent() is not None:
+        return 0
+    return surf.get_width() * surf.get_height() * surf.get_bytesize()
+
+def frame_set_bytes(frames):
+    size = 0
+    for flip in (False, True):
+        size += sum(surface_bytes(surf) for surf in frames.facings[flip])
+        size += sum(surface_bytes(surf) for surf in frames.silhouettes[flip])
+        size += sum((mask.get_size()[0] + 7) // 8 * mask.get_size()[1] for mask in frames.masks[flip])
+    return size
+
+def level_data_bytes(level_data):
+    atlas = next((image.get_parent() for image in level_data.images[1:]), None)
+    size = surface_bytes(atlas) if atlas is not None else 0
+    return size + sum(len(layer) * layer.itemsize for layer in level_data.layers.values())
+
+def chunks_bytes(chunks):
+    return sum(surface_bytes(surface) for surface, pos in chunks.values())
+
+class AssetManager:
+    # per-level assets loaded on first use and kept warm in LRU order; whatever the
+    # active level doesn't reference is evicted once the resident total passes the budget
+    def __init__(self, atlas, budget = ASSET_BUDGET):
+        self.atlas = atlas
+        self.budget = budget
+        self.entries = OrderedDict() # key: (asset_class, value, size), least recently used first
+        self.pinned = set()
+        self.lock = Lock() # levels are built on the loader thread
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key, asset_class, load, measure):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return self.entries[key][1]
+        value = load()
+        with self.lock:
+            self.entries[key] = (asset_class, value, measure(value))
+            self.stats['misses'] += 1
+        return value
+
+    def frames(self, name):
+        return self.get(('frames', name), 'sprites', lambda: FrameSet(self.atlas.frames(name)), frame_set_bytes)
+
+    def level_data(self, level_num):
+        return self.get(('tiles', level_num), 'tiles', lambda: load_level_data(level_num), level_data_bytes)
+
+    def chunks(self, level_num, bake):
+        return self.get(('chunks', level_num), 'chunks', bake, chunks_bytes)
+
+    def background(self, file_name, height, backdrop = None):
+        # scaled once per height, levels of the same size share the strip
+        return self.get(('background', file_name, height, backdrop), 'backgrounds', lambda: load_layer(file_name, height, backdrop),
+                        lambda layer: surface_bytes(layer[0]))
+
+    def background_keys(self, level_num, level_data):
+        """Keys of a level's scenery layers, far to near, the farthest one flattened onto BG_COLOR"""
+        world_height = level_data.height * TILE_SIZE
+        return [('background', file_name, layer_height(factor_y, world_height), None if i else BG_COLOR)
+                for i, (file_name, _, factor_y, _) in enumerate(LAYERS.get(level_num, ()))]
+
+    def background_layers(self, level_num, level_data):
+        # (strip, opaque, factor_x, factor_y, optional) per layer, as Parallax takes them
+        return [(*self.background(*key[1:]), factor_x, factor_y, optional)
+                for key, (_, factor_x, factor_y, optional) in zip(self.background_keys(level_num, level_data), LAYERS.get(level_num, ()))]
+
+    def level_keys(self, level_num, level_data):
+        """Every key a level uses, from its tile layers and the entities it places"""
+        names = {obj.name for obj in level_data.objects('Entities')}
+        frames = [frame for name in sorted(names, key = str) for frame in ENTITY_FRAMES.get(name, ())]
+        return ([('tiles', level_num), ('chunks', level_num)] + [('frames', name) for name in dict.fromkeys(frames + list(ALWAYS_FRAMES))]
+                + self.background_keys(level_num, level_data))
+
+    def activate(self, keys):
+        """Pin the swapped-in level's assets and evict the least recently used rest down to the budget"""
+        with self.lock:
+            self.pinned = set(keys)
+            for key in keys:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+            total = sum(size for _, _, size in self.entries.values())
+            for key in list(self.entries):
+                if total <= self.budget:
+                    break
+                if key not in self.pinned:
+                    total -= self.entries.pop(key)[2]
+                    self.stats['evictions'] += 1
+
+    def report(self):
+        """Resident bytes per asset class, the shared atlas included"""
+        with self.lock:
+            resident = {'atlas': self.atlas.memory()}
+            counts = {}
+            for asset_class, _, size in self.entries.values():
+                resident[asset_class] = resident.get(asset_class, 0) + size
+                counts[asset_class] = counts.get(asset_class, 0) + 1
+            return {'resident': resident, 'counts': counts, 'total': sum(resident.values()), 'budget': self.budget, **self.stats}
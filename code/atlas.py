@@ -0,0 +1,167 @@
+from settings import *
+from levels import CACHE_DIR, write_cache
+from os import listdir
+from os.path import exists, isdir
+import hashlib
+import pickle
+import zlib
+
+ATLAS_PATH = join(CACHE_DIR, 'assets.atlas')
+ATLAS_VERSION = 1
+PAGE_WIDTH = 1024
+PAGE_HEIGHT = 2048
+
+# name: (path, None | (width, height) | scale factor), a folder path becomes a list of frames
+ASSETS = {
+    'v_icon': (('data', 'graphics', 'V.png'), None),
+    'diamond': (('images', 'collectibles', 'diamond'), None),
+    'health_potion': (('images', 'collectibles', 'health_potion'), None),
+    'health_potion_icon': (('images', 'collectibles', 'health_potion', '09.png'), None),
+    'player': (('images', 'player'), None),
+    'bullet': (('images', 'gun', 'bullet.png'), None),
+    'fire': (('images', 'gun', 'fire.png'), None),
+    'bee': (('images', 'enemies', 'bee'), None),
+    'worm': (('images', 'enemies', 'worm'), None),
+    'coin': (('images', 'collectibles', 'coin'), None),
+    'trader': (('images', 'friendly', 'trader'), 1.5),
+    'inventory': (('images', 'ui', 'inventory.png'), (100, 300)),
+    'score_panel': (('images', 'ui', 'score_backdrop.png'), (290, 200)),
+    'status_scroll': (('images', 'ui', 'banner.png'), (400, 80)),
+    'shop_ui': (('images', 'ui', 'shop_inv1.png'), (800, 800)),
+    'dialogue': (('images', 'ui', 'dialogue.png'), (300, 150)),
+    'background': (('data', 'graphics', 'bg2.jpg'), (WINDOW_WIDTH, WINDOW_HEIGHT)),
+}
+OPAQUE = {'background'} # packed on their own page without per-pixel alpha
+
+def source_paths(path):
+    full_path = join(*path)
+    if isdir(full_path):
+        # same order as support.import_folder
+        return [join(full_path, name) for name in sorted(listdir(full_path), key = lambda name: int(name.split('.')[0]))]
+    return [full_path]
+
+def source_key(assets = ASSETS):
+    # hash of every source file and how it is scaled, any edit rebuilds the atlas
+    digest = hashlib.sha1(repr((ATLAS_VERSION, PAGE_WIDTH, PAGE_HEIGHT, sorted(assets.items()))).encode())
+    for name, (path, _) in sorted(assets.items()):
+        for file_path in source_paths(path):
+            digest.update(file_path.encode())
+            with open(file_path, 'rb') as file:
+                digest.update(file.read())
+    return digest.hexdigest()
+
+def scaled(surf, scale):
+    if scale is None:
+        return surf
+    if isinstance(scale, tuple):
+        return pygame.transform.scale(surf, scale)
+    return pygame.transform.scale_by(surf, scale)
+
+def pack(sizes):
+    # shelf packing, tallest first; returns (page, x, y) per size in input order
+    order = sorted(range(len(sizes)), key = lambda i: -sizes[i][1])
+    places = [None] * len(sizes)
+    page, x, y, shelf_height = 0, 0, 0, 0
+    for i in order:
+        width, height = sizes[i]
+        if x + width > PAGE_WIDTH:
+            x, y, shelf_height = 0, y + shelf_height, 0
+        if y + height > PAGE_HEIGHT:
+            page, x, y, shelf_height = page + 1, 0, 0, 0
+        places[i] = (page, x, y)
+        x += width
+        shelf_height = max(shelf_height, height)
+    return places
+
+def build_atlas(key = None):
+    """Load, scale and pack every asset, then write the atlas cache"""
+    # identical (file, scale) pairs are packed once and shared between names
+    images = {}
+    manifest = {}
+    for name, (path, scale) in ASSETS.items():
+        entries = []
+        for file_path in source_paths(path):
+            image_key = (file_path, scale, name in OPAQUE)
+            if image_key not in images:
+                images[image_key] = scaled(pygame.image.load(file_path), scale)
+            entries.append(image_key)
+        manifest[name] = entries
+
+    pages = []
+    regions = {}
+    for opaque in (False, True):
+        keys = [image_key for image_key in images if image_key[2] == opaque]
+        if not keys:
+            continue
+        places = pack([images[image_key].get_size() for image_key in keys])
+        first_page = len(pages)
+        for image_key, (page, x, y) in zip(keys, places):
+            regions[image_key] = (first_page + page, (x, y, *images[image_key].get_size()))
+        for page in range(max(place[0] for place in places) + 1):
+            used = [(images[image_key], place) for image_key, place in zip(keys, places) if place[0] == page]
+            width = max(place[1] + surf.get_width() for surf, place in used)
+            height = max(place[2] + surf.get_height() for surf, place in used)
+            surf = pygame.Surface((width, height), 0 if opaque else pygame.SRCALPHA, 24 if opaque else 32)
+            for image, (_, x, y) in used:
+                surf.blit(image, (x, y))
+            data = pygame.image.tobytes(surf, 'RGB' if opaque else 'RGBA')
+            # mostly transparent pages shrink a lot, photos barely do and inflating them costs more than reading
+            packed = zlib.compress(data)
+            compressed = len(packed) * 2 < len(data)
+            pages.append((surf.get_size(), opaque, compressed, packed if compressed else data))
+
+    compiled = {
+        'version': ATLAS_VERSION,
+        'key': key or source_key(),
+        'pages': pages,
+        'manifest': {name: [regions[image_key] for image_key in entries] for name, entries in manifest.items()},
+    }
+    write_cache(ATLAS_PATH, pickle.dumps(compiled, pickle.HIGHEST_PROTOCOL))
+    return compiled
+
+def read_atlas():
+    key = source_key()
+    if exists(ATLAS_PATH):
+        try:
+            with open(ATLAS_PATH, 'rb') as file:
+                compiled = pickle.load(file)
+            if compiled['version'] == ATLAS_VERSION and compiled['key'] == key:
+                return compiled
+        except Exception:
+            # truncated or from an older layout, either way it's rebuilt
+            pass
+    return build_atlas(key)
+
+class Atlas:
+    def __init__(self, compiled):
+        self.pages = []
+        for size, opaque, compressed, data in compiled['pages']:
+            if compressed:
+                data = zlib.decompress(data)
+            if opaque:
+                self.pages.append(pygame.image.frombytes(data, size, 'RGB').convert())
+            else:
+                self.pages.append(pygame.image.frombytes(data, size, 'RGBA').convert_alpha())
+        self.manifest = compiled['manifest']
+
+    def region(self, page, rect):
+        return self.pages[page].subsurface(rect)
+
+    def image(self, name):
+        return self.region(*self.manifest[name][0])
+
+    def frames(self, name):
+        return [self.region(*region) for region in self.manifest[name]]
+
+    def memory(self):
+        return sum(page.get_width() * page.get_height() * page.get_bytesize() for page in self.pages)
+
+def load_atlas():
+    return Atlas(read_atlas())
+
+if __name__ == '__main__':
+    # rebuild the atlas cache, run from the project root: python code/atlas.py
+    compiled = build_atlas()
+    for i, (size, opaque, compressed, data) in enumerate(compiled['pages']):
+        print(f'page {i}: {size[0]}x{size[1]}{" opaque" if opaque else ""}, {len(data)} bytes{" compressed" if compressed else ""}')
+    print(f'{len(compiled["manifest"])} named assets')
@@ -0,0 +1,161 @@
+from settings import *
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+from inputs import RandomInput, PatrolInput
+from replay import ReplayInput
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+BOTS = {'random': RandomInput, 'patrol': PatrolInput}
+
+def parse_levels(text):
+    # '1-7', '2,4,6' or a mix of both
+    levels = []
+    for part in text.split(','):
+        first, _, last = part.partition('-')
+        levels.extend(range(int(first), int(last or first) + 1))
+    return levels
+
+def make_jobs(levels, bots, runs, frames, retries, seed = 0, replays = ()):
+    jobs = [{'replay': path} for path in replays]
+    for run in range(runs):
+        for level in levels:
+            for bot in bots:
+                jobs.append({'level': level, 'bot': bot, 'seed': seed + len(jobs), 'frames': frames, 'retries': retries})
+    return jobs
+
+def play_level(game, level, frames, retries):
+    # one level until it's completed, the bot dies more than retries times or frames run out;
+    # it's the last level of the run, so completing it doesn't start building the next one
+    game.current_level = level
+    game.total_levels = level
+    stepped = 0
+    while stepped < frames and game.running:
+        if game.game_state == 'game_over':
+            if game.death_total > retries:
+                break
+            game.retry_level()
+        game.step()
+        stepped += 1
+        if game.current_level != level:
+            break
+    return stepped
+
+def run_job(job):
+    """Play one job in a fresh headless game, returns its stats"""
+    # imported here so the parent process never sets up pygame
+    from main import Game
+    stats = dict(job)
+    start = time.perf_counter()
+    try:
+        with redirect_stdout(io.StringIO()):
+            if 'replay' in job:
+                replay = ReplayInput(job['replay'])
+                game = Game(headless = True, input_source = replay, seed = replay.seed)
+                setup = time.perf_counter()
+                frames = game.play(replay, render = False, speed = 0)
+                stats.update(level = replay.level, bot = 'replay', diverged = replay.divergence)
+                completed = game.current_level > replay.level
+            else:
+                game = Game(headless = True, input_source = BOTS[job['bot']](job['seed']), seed = job['seed'])
+                setup = time.perf_counter()
+                frames = play_level(game, job['level'], job['frames'], job['retries'])
+                completed = game.current_level > job['level']
+    except Exception as error:
+        stats.update(error = f'{type(error).__name__}: {error}', frames = 0, wall = time.perf_counter() - start)
+        return stats
+
+    player = getattr(game, 'player', None)
+    collected = total = 0
+    if player is not None:
+        collected, total = player.cherries + player.coins, player.total_cherries + player.total_coins
+    stats.update(completed = completed, deaths = game.death_total, frames = frames,
+                 points = player.points if player else 0, kills = player.kills if player else 0,
+                 collected = collected / total if total else 1.0,
+                 setup = setup - start, wall = time.perf_counter() - start)
+    return stats
+
+def summarize(results, wall, workers):
+    levels = {}
+    for stats in results:
+        levels.setdefault(stats.get('level', 0), []).append(stats)
+
+    summary = {}
+    for level, runs in sorted(levels.items()):
+        played = [stats for stats in runs if 'error' not in stats]
+        mean = lambda key: sum(stats[key] for stats in played) / len(played) if played else 0
+        summary[level] = {
+            'runs': len(runs),
+            'errors': len(runs) - len(played),
+            'completion': mean('completed'),
+            'deaths': mean('deaths'),
+            'points': mean('points'),
+            'kills': mean('kills'),
+            'collected': mean('collected'),
+            'frames': mean('frames'),
+        }
+
+    frames = sum(stats['frames'] for stats in results)
+    busy = sum(stats['wall'] for stats in results)
+    return {
+        'levels': summary,
+        'runs': len(results),
+        'errors': sum(level['errors'] for level in summary.values()),
+        'diverged': sum(1 for stats in results if stats.get('diverged') is not None),
+        'frames': frames,
+        'wall': wall,
+        'workers': workers,
+        'throughput': frames / max(wall, 1e-9), # simulated frames per wall second, the number to track
+        'efficiency': busy / max(wall * workers, 1e-9), # 1.0 when every worker was busy the whole batch
+    }
+
+def run_batch(jobs, workers = None, progress = print):
+    workers = workers or os.cpu_count() or 1
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers = workers) as pool:
+        for future in as_completed([pool.submit(run_job, job) for job in jobs]):
+            stats = future.result()
+            results.append(stats)
+            if progress:
+                outcome = stats.get('error') or ('completed' if stats['completed'] else 'not completed')
+                progress(f'[{len(results)}/{len(jobs)}] level {stats.get("level", "?")} {stats.get("bot", "")} '
+                         f'seed {stats.get("seed", "-")}: {outcome}, {stats["frames"]} frames in {stats["wall"]:.2f}s')
+    return results, summarize(results, time.perf_counter() - start, workers)
+
+def print_report(report):
+    print(f'{"level":>5} {"runs":>5} {"done":>6} {"deaths":>7} {"points":>8} {"kills":>6} {"collected":>10} {"frames":>8} {"errors":>7}')
+    for level, row in report['levels'].items():
+        print(f'{level:>5} {row["runs"]:>5} {row["completion"]:>6.0%} {row["deaths"]:>7.2f} {row["points"]:>8.0f} '
+              f'{row["kills"]:>6.1f} {row["collected"]:>10.0%} {row["frames"]:>8.0f} {row["errors"]:>7}')
+    print(f'{report["runs"]} runs, {report["errors"]} errors, {report["diverged"]} diverged replays, '
+          f'{report["frames"]} frames in {report["wall"]:.2f}s on {report["workers"]} workers '
+          f'({report["efficiency"]:.0%} busy)')
+    print(f'throughput: {report["throughput"]:.0f} simulated frames/s')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Play many headless runs in parallel and report per-level stats')
+    parser.add_argument('--levels', type = parse_levels, default = '1-6', help = "levels to play, like '1-6' or '2,5'")
+    parser.add_argument('--bots', nargs = '+', choices = sorted(BOTS), default = sorted(BOTS))
+    parser.add_argument('--runs', type = int, default = 4, help = 'runs per level and bot')
+    parser.add_argument('--frames', type = int, default = 180 * PHYSICS_RATE, help = 'physics steps per run at most')
+    parser.add_argument('--retries', type = int, default = 2, help = 'deaths a bot may retry the level after')
+    parser.add_argument('--seed', type = int, default = 0, help = 'seed of the first run, the others count up from it')
+    parser.add_argument('--replays', nargs = '*', default = (), metavar = 'PATH', help = 'replay files to play along')
+    parser.add_argument('--workers', type = int, default = None, help = 'processes (default: one per core)')
+    parser.add_argument('--json', metavar = 'PATH', help = 'write every run and the summary to a JSON file')
+    parser.add_argument('--quiet', action = 'store_true', help = 'no line per finished run')
+    args = parser.parse_args()
+
+    jobs = make_jobs(args.levels, args.bots, args.runs,
+                     args.frames, args.retries, args.seed, args.replays)
+    results, report = run_batch(jobs, args.workers, None if args.quiet else print)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'summary': report, 'runs': results}, file, indent = 1)
+    sys.exit(1 if report['errors'] or report['diverged'] else 0)
@@ -0,0 +1,42 @@
+from settings import *
+
+class SweepAndPrune:
+    # sort both groups on rect.left and sweep along x, only overlapping rects become candidate pairs
+    def __init__(self):
+        # left/right are the whole groups, tested_* the subsets actually swept when the caller pre-filters them
+        self.stats = {'left': 0, 'right': 0, 'tested_left': 0, 'tested_right': 0, 'candidates': 0, 'hits': 0}
+
+    def candidates(self, left_group, right_group):
+        entries = [(sprite.rect.left, 0, sprite) for sprite in left_group]
+        entries += [(sprite.rect.left, 1, sprite) for sprite in right_group]
+        entries.sort(key = lambda entry: entry[0])
+
+        pairs = []
+        active = [[], []]
+        for left, side, sprite in entries:
+            # the other side's interval list is pruned while it is tested against this sprite
+            still_active = []
+            for other in active[1 - side]:
+                if other.rect.right > left:
+                    still_active.append(other)
+                    if sprite.rect.colliderect(other.rect):
+                        pairs.append((sprite, other) if side == 0 else (other, sprite))
+            active[1 - side] = still_active
+            active[side].append(sprite)
+        return pairs
+
+    def collide(self, left_group, right_group, narrowphase = pygame.sprite.collide_mask, sizes = None):
+        """Return {left_sprite: [right_sprites]} for every pair that passes the narrowphase;
+        sizes is (left, right) of the full groups when the ones passed in are pre-filtered"""
+        pairs = self.candidates(left_group, right_group)
+        hits = {}
+        for left, right in pairs:
+            if narrowphase(left, right):
+                hits.setdefault(left, []).append(right)
+
+        self.stats['left'], self.stats['right'] = sizes or (len(left_group), len(right_group))
+        self.stats['tested_left'] = len(left_group)
+        self.stats['tested_right'] = len(right_group)
+        self.stats['candidates'] = len(pairs)
+        self.stats['hits'] = sum(len(sprites) for sprites in hits.values())
+        return hits
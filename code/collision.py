@@ -0,0 +1,93 @@
+from settings import *
+from array import array
+
+def merge_tiles(solid, width, height):
+    """Cover the solid cells of a row-major grid with maximal rectangles, as (x, y, width, height) in tiles"""
+    # greedy meshing: grow each run as wide as it goes, then down while the rows below match
+    todo = bytearray(1 if cell else 0 for cell in solid)
+    rects = []
+    for y in range(height):
+        for x in range(width):
+            if not todo[y * width + x]:
+                continue
+            run = 1
+            while x + run < width and todo[y * width + x + run]:
+                run += 1
+            rows = 1
+            while y + rows < height and all(todo[(y + rows) * width + x:(y + rows) * width + x + run]):
+                rows += 1
+            for row in range(y, y + rows):
+                todo[row * width + x:row * width + x + run] = bytes(run)
+            rects.append((x, y, run, rows))
+    return rects
+
+class TileGrid:
+    # occupancy grid for the static 'Main' layer, each solid cell points at the merged collider covering it
+    def __init__(self, width, height, tile_size = TILE_SIZE):
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.owners = array('I', bytes(4 * width * height))
+        self.rects = [None] # collider 0 means empty
+
+        # cells a push-out can move the player into during a single resolve pass
+        self.margin = 1
+
+    def add_rect(self, x, y, width = 1, height = 1):
+        # one collider spanning width x height tiles from tile (x, y)
+        index = len(self.rects)
+        size = self.tile_size
+        self.rects.append(pygame.FRect(x * size, y * size, width * size, height * size))
+        for row in range(max(y, 0), min(y + height, self.height)):
+            for col in range(max(x, 0), min(x + width, self.width)):
+                self.owners[row * self.width + col] = index
+
+    def set_solid(self, x, y):
+        if self.in_bounds(x, y) and not self.owners[y * self.width + x]:
+            self.add_rect(x, y)
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def is_solid(self, x, y):
+        if self.in_bounds(x, y):
+            return self.owners[y * self.width + x] != 0
+        return False
+
+    def cell_range(self, rect):
+        left = max(int(rect.left // self.tile_size) - self.margin, 0)
+        right = min(int(rect.right // self.tile_size) + self.margin, self.width - 1)
+        top = max(int(rect.top // self.tile_size) - self.margin, 0)
+        bottom = min(int(rect.bottom // self.tile_size) + self.margin, self.height - 1)
+        return left, right, top, bottom
+
+    def rects_near(self, rect):
+        # each collider once, in the row-major order of the first cell seen; the rects are shared, don't move them
+        left, right, top, bottom = self.cell_range(rect)
+        owners, width, rects = self.owners, self.width, self.rects
+        seen = set()
+        for y in range(top, bottom + 1):
+            row = y * width
+            for x in range(left, right + 1):
+                index = owners[row + x]
+                if index and index not in seen:
+                    seen.add(index)
+                    yield rects[index]
+
+    def collides(self, rect):
+        for tile_rect in self.rects_near(rect):
+            if tile_rect.colliderect(rect):
+                return True
+        return False
+
+    def lift(self, rect):
+        # stand a rect placed inside the ground (a spawn point) on top of it; per-tile push-outs
+        # used to nudge it out sideways, a merged collider would shove it to the end of the run
+        for _ in range(self.height):
+            hit = next((tile_rect for tile_rect in self.rects_near(rect) if tile_rect.colliderect(rect)), None)
+            if hit is None:
+                return
+            rect.bottom = hit.top
+
+    def __len__(self):
+        return len(self.rects) - 1
@@ -1,4 +1,6 @@
 from settings import *
+from math import floor
+from kinematics import KinematicBodies
 
 class AllSprites(pygame.sprite.Group):
     def __init__(self):
@@ -6,11 +8,256 @@ class AllSprites(pygame.sprite.Group):
         self.display_surface = pygame.display.get_surface()
         self.offset = pygame.Vector2()
 
-    def draw(self, target_pos):
+        # static tiles are baked into chunk surfaces instead of being sprites
+        self.static_tiles = []
+        self.chunks = {}
+        self.chunk_pixels = CHUNK_SIZE * TILE_SIZE
+
+        # coarse cell buckets of dynamic sprites, keyed by the cell of their topleft
+        self.buckets = {}
+        self.sprite_cells = {}
+        self.pending = {}
+        self.draw_order = {}
+        self.next_order = 0
+
+        # topleft of each sprite before the last fixed step, drawing lerps from it to the current rect
+        self.previous = {}
+
+        # sprites with body_fields() move in one batched step, the rest are updated one by one
+        self.bodies = KinematicBodies() if BATCHED_KINEMATICS else None
+        self.scalar = {}
+
+        # sprites that never move and only animate, they are bucketed once and animated when drawn
+        self.idle = {}
+
+        # profiling counters from the last draw
+        self.drawn_count = 0
+        self.culled_count = 0
+
+    def cell_of(self, sprite):
+        return (int(sprite.rect.left // CULL_BUCKET_SIZE), int(sprite.rect.top // CULL_BUCKET_SIZE))
+
+    def add_internal(self, sprite, layer = None):
+        super().add_internal(sprite, layer)
+        if sprite not in self.draw_order:
+            self.draw_order[sprite] = self.next_order
+            self.next_order += 1
+            # sprites are added before their rect is final, so bucket them on the next update or draw
+            self.pending[sprite] = None
+            if getattr(sprite, 'idle', False):
+                self.idle[sprite] = None
+            elif not (self.bodies is not None and hasattr(sprite, 'body_fields')):
+                self.scalar[sprite] = None
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self.pending.pop(sprite, None)
+        self.scalar.pop(sprite, None)
+        self.idle.pop(sprite, None)
+        if self.bodies is not None and sprite in self.bodies:
+            self.bodies.remove(sprite)
+        cell = self.sprite_cells.pop(sprite, None)
+        if cell is not None:
+            del self.buckets[cell][sprite]
+            if not self.buckets[cell]:
+                del self.buckets[cell]
+        self.draw_order.pop(sprite, None)
+        self.previous.pop(sprite, None)
+
+    def place(self, sprite):
+        cell = self.cell_of(sprite)
+        old_cell = self.sprite_cells.get(sprite)
+        if cell != old_cell:
+            if old_cell is not None:
+                del self.buckets[old_cell][sprite]
+                if not self.buckets[old_cell]:
+                    del self.buckets[old_cell]
+            self.buckets.setdefault(cell, {})[sprite] = None
+            self.sprite_cells[sprite] = cell
+
+    def place_pending(self):
+        for sprite in self.pending:
+            if sprite in self.scalar or sprite in self.idle:
+                self.place(sprite)
+            else:
+                self.bodies.add(sprite)
+        self.pending = {}
+
+    def update(self, dt):
+        self.place_pending()
+        if self.bodies is not None:
+            self.bodies.step(dt)
+        for sprite in list(self.scalar):
+            self.previous[sprite] = sprite.rect.topleft
+            sprite.update(dt)
+            if sprite in self.sprite_cells: # skip sprites killed during their update
+                self.place(sprite)
+
+    def visible_sprites(self):
+        self.place_pending()
+        view_rect = pygame.FRect(-self.offset.x, -self.offset.y, WINDOW_WIDTH, WINDOW_HEIGHT).inflate(CULL_MARGIN * 2, CULL_MARGIN * 2)
+        left = int(view_rect.left // CULL_BUCKET_SIZE)
+        top = int(view_rect.top // CULL_BUCKET_SIZE)
+        right = int(view_rect.right // CULL_BUCKET_SIZE)
+        bottom = int(view_rect.bottom // CULL_BUCKET_SIZE)
+        visible = []
+        for cx in range(left, right + 1):
+            for cy in range(top, bottom + 1):
+                bucket = self.buckets.get((cx, cy))
+                if bucket:
+                    visible.extend(sprite for sprite in bucket if view_rect.colliderect(sprite.rect))
+        if self.bodies is not None:
+            for sprite, previous_x in self.bodies.visible(view_rect):
+                self.previous[sprite] = (previous_x, sprite.rect.y)
+                visible.append(sprite)
+        visible.sort(key = self.draw_order.__getitem__)
+        return visible
+
+    def collision_candidates(self, bullets, enemies, player_rect):
+        """(bullets, enemies, enemies near the player) worth testing, in group order"""
+        if self.bodies is None:
+            return bullets, enemies, enemies
+        self.place_pending()
+        order = self.draw_order.__getitem__
+        return tuple(sorted(sprites, key = order) for sprites in self.bodies.colliding(player_rect))
+
+    def add_static(self, pos, surf):
+        # pre-baked tiles keep the order they were added in, so add bottom layers first
+        if not surf.get_flags() & pygame.SRCALPHA:
+            surf = surf.convert_alpha() # keeps surface alpha (e.g. hidden portals) when baked
+        self.static_tiles.append((pos, surf))
+
+    def chunk_cells(self, rect):
+        for cx in range(rect.left // self.chunk_pixels, (rect.right - 1) // self.chunk_pixels + 1):
+            for cy in range(rect.top // self.chunk_pixels, (rect.bottom - 1) // self.chunk_pixels + 1):
+                yield cx, cy
+
+    def bake_static(self, progress = None):
+        # each chunk only covers the bounding box of its tiles, so memory follows the tiles and not the map size
+        bounds = {}
+        for pos, surf in self.static_tiles:
+            rect = surf.get_rect(topleft = pos)
+            for cx, cy in self.chunk_cells(rect):
+                area = rect.clip((cx * self.chunk_pixels, cy * self.chunk_pixels, self.chunk_pixels, self.chunk_pixels))
+                bounds[(cx, cy)] = bounds[(cx, cy)].union(area) if (cx, cy) in bounds else area
+
+        # cell: (surface, world topleft of the surface)
+        self.chunks = {cell: (pygame.Surface(area.size, pygame.SRCALPHA).convert_alpha(), area.topleft) for cell, area in bounds.items()}
+        for i, (pos, surf) in enumerate(self.static_tiles):
+            if progress and i % 256 == 0:
+                progress(i / len(self.static_tiles))
+            rect = surf.get_rect(topleft = pos)
+            for cell in self.chunk_cells(rect):
+                chunk, (x, y) = self.chunks[cell]
+                chunk.blit(surf, (rect.left - x, rect.top - y))
+        self.static_tiles = []
+
+    def empty(self):
+        super().empty()
+        self.static_tiles = []
+        self.chunks = {}
+        self.buckets = {}
+        self.sprite_cells = {}
+        self.pending = {}
+        self.draw_order = {}
+        self.previous = {}
+        self.bodies = KinematicBodies() if BATCHED_KINEMATICS else None
+        self.scalar = {}
+        self.idle = {}
+
+    def interpolated(self, sprite, alpha):
+        x, y = sprite.rect.topleft
+        previous = self.previous.get(sprite)
+        if previous is None or alpha >= 1:
+            return x, y
+        px, py = previous
+        if abs(x - px) > INTERPOLATION_SNAP or abs(y - py) > INTERPOLATION_SNAP:
+            return x, y # teleported, don't sweep across the map
+        return px + (x - px) * alpha, py + (y - py) * alpha
+
+    def interpolated_center(self, sprite, alpha):
+        x, y = self.interpolated(sprite, alpha)
+        return x + sprite.rect.width / 2, y + sprite.rect.height / 2
+
+    def draw_static(self):
+        # floor so chunk edges land on the same pixel the per-tile blits used to
+        offset_x, offset_y = floor(self.offset.x), floor(self.offset.y)
+        left = int(-self.offset.x // self.chunk_pixels)
+        top = int(-self.offset.y // self.chunk_pixels)
+        right = int((-self.offset.x + WINDOW_WIDTH) // self.chunk_pixels)
+        bottom = int((-self.offset.y + WINDOW_HEIGHT) // self.chunk_pixels)
+        for cx in range(left, right + 1):
+            for cy in range(top, bottom + 1):
+                chunk = self.chunks.get((cx, cy))
+                if chunk:
+                    surface, (x, y) = chunk
+                    self.display_surface.blit(surface, (x + offset_x, y + offset_y))
+
+    def aim(self, target_pos):
+        # camera offset centering target_pos, backgrounds drawn before the sprites scroll with it
         self.offset.x = -(target_pos[0] - WINDOW_WIDTH / 2)
         self.offset.y = -(target_pos[1] - WINDOW_HEIGHT / 2)
 
-        for sprite in self:
-            self.display_surface.blit(sprite.image, sprite.rect.topleft + self.offset)
-            if hasattr(sprite, 'draw_health_bar'):
-                sprite.draw_health_bar(self.display_surface, self.offset)
\ No newline at end of file
+    def draw(self, target_pos, alpha = 1):
+        self.aim(target_pos)
+        self.draw_static()
+        visible = self.visible_sprites()
+        self.drawn_count = len(visible)
+        self.culled_count = len(self) - self.drawn_count
+        for sprite in visible:
+            if sprite in self.idle:
+                sprite.animate_idle()
+            if alpha >= 1:
+                self.display_surface.blit(sprite.image, sprite.rect.topleft + self.offset)
+                if hasattr(sprite, 'draw_health_bar'):
+                    sprite.draw_health_bar(self.display_surface, self.offset)
+            else:
+                x, y = self.interpolated(sprite, alpha)
+                offset = self.offset + (x - sprite.rect.left, y - sprite.rect.top)
+                self.display_surface.blit(sprite.image, sprite.rect.topleft + offset)
+                if hasattr(sprite, 'draw_health_bar'):
+                    sprite.draw_health_bar(self.display_surface, offset)
+
+class CollectibleSprites(pygame.sprite.Group):
+    # collectibles never move: bucket each one under every cell its rect covers, once,
+    # so the player only tests the few around it instead of the whole level every step
+    def __init__(self, cell_size = CULL_BUCKET_SIZE):
+        super().__init__()
+        self.cell_size = cell_size
+        self.cells = {}
+        self.sprite_cells = {}
+        self.pending = {} # added before their rect is final, bucketed on the next query
+
+    def add_internal(self, sprite, layer = None):
+        super().add_internal(sprite, layer)
+        self.pending[sprite] = None
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self.pending.pop(sprite, None)
+        for cell in self.sprite_cells.pop(sprite, ()):
+            del self.cells[cell][sprite]
+            if not self.cells[cell]:
+                del self.cells[cell]
+
+    def cell_range(self, rect):
+        size = self.cell_size
+        return [(cx, cy) for cx in range(int(rect.left // size), int(rect.right // size) + 1)
+                for cy in range(int(rect.top // size), int(rect.bottom // size) + 1)]
+
+    def colliding(self, rect):
+        """Collectibles whose rect collides with rect, in group order"""
+        for sprite in self.pending:
+            cells = self.sprite_cells[sprite] = self.cell_range(sprite.rect)
+            for cell in cells:
+                self.cells.setdefault(cell, {})[sprite] = None
+        self.pending = {}
+
+        found = {}
+        for cell in self.cell_range(rect):
+            for sprite in self.cells.get(cell, ()):
+                if rect.colliderect(sprite.rect):
+                    found[sprite] = None
+        if len(found) < 2:
+            return list(found)
+        return [sprite for sprite in self.sprites() if sprite in found]
@@ -0,0 +1,114 @@
+from settings import *
+
+GREEN = (76, 153, 0)
+BLACK = (0, 0, 0)
+RED = (255, 0, 0)
+
+class HudWidget:
+    def __init__(self, name, value, render):
+        self.name = name
+        self.value = value
+        self.render = render
+        self.surf = None
+        self.last_value = None
+
+        # invalidation stats
+        self.renders = 0
+        self.skips = 0
+
+    def refresh(self):
+        value = self.value()
+        if self.surf is not None and value == self.last_value:
+            self.skips += 1
+            return False
+        self.surf = self.render(value)
+        self.last_value = value
+        self.renders += 1
+        return True
+
+class Hud:
+    # score panel and potion inventory, composed into one cached surface
+    def __init__(self, game):
+        self.game = game
+        self.display_surface = game.display_surface
+        self.font = game.font
+        panel, inventory = game.ui_assets['score_panel'], game.ui_assets['inventory']
+        self.surf = pygame.Surface((10 + panel.get_width(), 300 + inventory.get_height()), pygame.SRCALPHA)
+        self.composes = 0
+
+        player = lambda: self.game.player
+        self.widgets = {
+            'coins': HudWidget('coins', lambda: (player().coins, player().total_coins),
+                lambda value: self.text(f'Coins: {value[0]} / {value[1]}', GREEN if value[0] == value[1] else BLACK)),
+            'diamonds': HudWidget('diamonds', lambda: (player().diamonds, player().total_diamonds),
+                lambda value: self.text(f'Diamonds: {value[0]} / {value[1]}', GREEN if value[0] == value[1] else BLACK)),
+            'kills': HudWidget('kills', lambda: player().kills,
+                lambda value: self.text(f'Kills: {value}')),
+            'points': HudWidget('points', lambda: player().points,
+                lambda value: self.text(f'Score: {value}')),
+            'health': HudWidget('health', lambda: player().health,
+                lambda value: self.text(f'Health: {value}', RED if value < 50 else GREEN if value == 100 else BLACK)),
+            'potions': HudWidget('potions', lambda: player().health_pots, self.potion_count),
+            'level': HudWidget('level', lambda: (self.game.current_level, self.game.total_levels),
+                lambda value: self.text(f'Level: {value[0]} / {value[1]}')),
+            'total_coins': HudWidget('total_coins', lambda: self.game.level_start_coins + player().coins,
+                lambda value: self.text(f'Total Coins: {value}')),
+        }
+
+    def text(self, text, color = BLACK):
+        return self.font.render(text, True, color)
+
+    def potion_count(self, value):
+        white = self.font.render(str(value), True, BG_WHITE)
+        surf = pygame.Surface((white.get_width() + 1, white.get_height() + 1), pygame.SRCALPHA)
+        surf.blit(self.font.render(str(value), True, '#000000'), (1, 1))
+        surf.blit(white, (0, 0))
+        return surf
+
+    def compose(self):
+        # same layout the old display_score_area chain produced
+        ui_assets = self.game.ui_assets
+        widgets = self.widgets
+        self.surf.fill((0, 0, 0, 0))
+        self.surf.blit(ui_assets['score_panel'], (10, 10))
+
+        coins_rect = widgets['coins'].surf.get_rect(topleft = (45, 25))
+        diamonds_rect = widgets['diamonds'].surf.get_rect(topleft = (20, coins_rect.bottom + 10))
+        kills_rect = widgets['kills'].surf.get_rect(topleft = (20, diamonds_rect.bottom + 10))
+        points_rect = widgets['points'].surf.get_rect(topleft = (20, kills_rect.bottom + 10))
+        health_rect = widgets['health'].surf.get_rect(topleft = (30, points_rect.bottom + 10))
+        level_rect = widgets['level'].surf.get_rect(topleft = (30, health_rect.bottom + 10))
+        total_coins_rect = widgets['total_coins'].surf.get_rect(topleft = (30, level_rect.bottom + 10))
+        for name, rect in (('coins', coins_rect), ('diamonds', diamonds_rect), ('kills', kills_rect), ('points', points_rect), ('health', health_rect)):
+            self.surf.blit(widgets[name].surf, rect)
+
+        # potion inventory
+        inventory_x, inventory_y = 20, 300
+        self.surf.blit(ui_assets['inventory'], (inventory_x, inventory_y))
+        potion_x, potion_y = inventory_x + 25, inventory_y + 30
+        self.surf.blit(self.game.health_potion_icon, (potion_x, potion_y))
+        self.surf.blit(widgets['potions'].surf, (potion_x + 40, potion_y + 10))
+        self.surf.blit(self.game.v_icon, (potion_x + 75, potion_y + 10))
+
+        self.surf.blit(widgets['level'].surf, level_rect)
+        self.surf.blit(widgets['total_coins'].surf, total_coins_rect)
+        self.composes += 1
+
+    def draw(self):
+        dirty = False
+        for widget in self.widgets.values():
+            dirty = widget.refresh() or dirty
+        if dirty:
+            self.compose()
+        self.display_surface.blit(self.surf, (0, 0))
+
+    def stats(self):
+        stats = {name: {'renders': widget.renders, 'skips': widget.skips} for name, widget in self.widgets.items()}
+        stats['composes'] = self.composes
+        return stats
+
+    def counters(self):
+        # widget renders out of widget refreshes, and panel composes, for the profiler overlay
+        renders = sum(widget.renders for widget in self.widgets.values())
+        refreshes = renders + sum(widget.skips for widget in self.widgets.values())
+        return {'hud renders': f'{renders}/{refreshes}', 'hud composes': self.composes}
@@ -0,0 +1,69 @@
+from settings import *
+from random import Random
+
+class KeyState:
+    # answers keys[pygame.K_x] like the sequence pygame.key.get_pressed() returns
+    def __init__(self, keys = ()):
+        self.keys = frozenset(keys)
+
+    def __getitem__(self, key):
+        return key in self.keys
+
+class KeyboardInput:
+    def advance(self):
+        pass
+
+    def get_pressed(self):
+        return pygame.key.get_pressed()
+
+class ScriptedInput:
+    # script is a list with the held keys for each frame, or a function frame -> held keys
+    def __init__(self, script):
+        self.script = script
+        self.frame = 0
+        self.state = KeyState()
+
+    def advance(self):
+        if callable(self.script):
+            keys = self.script(self.frame)
+        else:
+            keys = self.script[self.frame] if self.frame < len(self.script) else ()
+        self.state = KeyState(keys)
+        self.frame += 1
+
+    def get_pressed(self):
+        return self.state
+
+class RandomInput(ScriptedInput):
+    # holds a random mix of the gameplay keys, re-rolled every hold_frames frames
+    keys = (pygame.K_LEFT, pygame.K_RIGHT, pygame.K_SPACE, pygame.K_f, pygame.K_v)
+
+    def __init__(self, seed = None, hold_frames = 20):
+        self.rng = Random(seed)
+        self.hold_frames = hold_frames
+        self.held = ()
+        super().__init__(self.roll)
+
+    def roll(self, frame):
+        if frame % self.hold_frames == 0:
+            self.held = self.rng.sample(self.keys, self.rng.randint(0, 2))
+        return self.held
+
+class PatrolInput(ScriptedInput):
+    # runs one way for leg_frames frames and turns, jumping and shooting on a steady beat
+    def __init__(self, seed = None, leg_frames = 240):
+        rng = Random(seed)
+        self.leg_frames = leg_frames
+        self.jump_every = rng.randint(20, 45)
+        self.shoot_every = rng.randint(10, 30)
+        self.offset = rng.randrange(leg_frames)
+        super().__init__(self.patrol)
+
+    def patrol(self, frame):
+        leg = (frame + self.offset) // self.leg_frames
+        keys = [pygame.K_RIGHT if leg % 2 == 0 else pygame.K_LEFT]
+        if frame % self.jump_every < 4:
+            keys.append(pygame.K_SPACE)
+        if frame % self.shoot_every == 0:
+            keys.append(pygame.K_f)
+        return keys
@@ -0,0 +1,179 @@
+from settings import *
+import numpy as np
+
+BULLET, BEE, WORM = 1, 2, 3
+
+# positions and sizes are float32 like FRect, so batched moves and overlap tests round the same way
+BODY_DTYPE = np.dtype([
+    ('kind', 'u1'),
+    ('active', '?'),
+    ('dying', '?'),
+    ('flip', '?'),
+    ('x', 'f4'),
+    ('px', 'f4'), # x before the last step, for render interpolation
+    ('y', 'f4'),
+    ('width', 'f4'),
+    ('height', 'f4'),
+    ('vx', 'f8'),
+    ('left', 'f4'), # worms: patrol span, bullets and bees: despawn span
+    ('right', 'f4'),
+    ('inside_y', '?'), # worm fits its patrol rect vertically
+    ('frame', 'f8'),
+    ('animation_speed', 'f8'),
+])
+
+class KinematicBodies:
+    # bees, worms and bullets integrated in one batched step; their sprites only
+    # get rect, frame and mask written back when they are drawn or may collide
+    def __init__(self, capacity = 256):
+        self.data = np.zeros(capacity, BODY_DTYPE)
+        self.sprites = [None] * capacity
+        self.rows = {}
+        self.free = []
+        self.count = 0 # high-water mark of used rows
+        self.groups = None # (bullet rows, enemy rows), only changes when a body is added or removed
+        self.stats = {'bodies': 0, 'synced': 0}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, sprite):
+        return sprite in self.rows
+
+    def add(self, sprite):
+        if self.free:
+            row = self.free.pop()
+        else:
+            if self.count == len(self.data):
+                self.data = np.concatenate((self.data, np.zeros(len(self.data), BODY_DTYPE)))
+                self.sprites += [None] * (len(self.data) - len(self.sprites))
+            row = self.count
+            self.count += 1
+
+        body = self.data[row]
+        body['x'] = body['px'] = sprite.rect.x
+        body['y'], body['width'], body['height'] = sprite.rect.y, sprite.rect.width, sprite.rect.height
+        body['left'], body['right'], body['inside_y'] = -np.inf, np.inf, True
+        body['frame'], body['animation_speed'] = getattr(sprite, 'frame_index', 0), 0
+        body['flip'] = getattr(sprite, 'flip', False)
+        body['dying'] = getattr(sprite, 'is_dying', False)
+        for name, value in sprite.body_fields().items():
+            body[name] = value
+        body['active'] = True
+
+        self.sprites[row] = sprite
+        self.rows[sprite] = row
+        self.groups = None
+        sprite.bodies = self
+
+    def remove(self, sprite):
+        row = self.rows.pop(sprite)
+        self.data[row]['active'] = False
+        self.sprites[row] = None
+        self.free.append(row)
+        self.groups = None
+        sprite.bodies = None
+
+    def freeze(self, sprite):
+        # a dying enemy stops moving and animating but still runs its constraint, its death timer kills it
+        self.data[self.rows[sprite]]['dying'] = True
+
+    def step(self, dt):
+        data = self.data[:self.count]
+        active, kind = data['active'], data['kind']
+        moving = active & ~data['dying']
+        data['px'] = data['x']
+        data['x'][moving] += data['vx'][moving] * dt
+        data['frame'][moving] += data['animation_speed'][moving] * dt
+
+        # constraints, same tests the per-sprite methods did on FRect
+        x, right_edge = data['x'], data['x'] + data['width']
+        worms = active & (kind == WORM)
+        turn = worms & ~(data['inside_y'] & (data['left'] <= x) & (right_edge <= data['right']))
+        data['vx'][turn] *= -1
+        data['flip'][turn] ^= True
+
+        gone = active & ((kind == BULLET) | (kind == BEE)) & ((right_edge < data['left']) | (x > data['right']))
+        for row in np.flatnonzero(gone).tolist():
+            self.sprites[row].kill()
+
+    def sync(self, rows):
+        data = self.data
+        sprites = self.sprites
+        for row, x, frame, flip, dying in zip(rows.tolist(), data['x'][rows].tolist(), data['frame'][rows].tolist(),
+                                              data['flip'][rows].tolist(), data['dying'][rows].tolist()):
+            sprite = sprites[row]
+            sprite.rect.x = x
+            if data['kind'][row] != BULLET:
+                sprite.flip = flip
+                if not dying:
+                    sprite.frame_index = frame
+                    sprite.set_frame(frame, flip)
+        self.stats['bodies'] = len(self.rows)
+        self.stats['synced'] += len(rows)
+
+    def sync_sprites(self, sprites):
+        self.sync(np.array([self.rows[sprite] for sprite in sprites], np.intp))
+
+    def visible(self, view_rect):
+        """Sync and return the sprites overlapping view_rect, with their previous x for interpolation"""
+        data = self.data[:self.count]
+        left, top, width, height = view_rect
+        x, y = data['x'], data['y']
+        rows = np.flatnonzero(data['active'] & (x < left + width) & (x + data['width'] > left)
+                              & (y < top + height) & (y + data['height'] > top))
+        self.sync(rows)
+        return [(self.sprites[row], px) for row, px in zip(rows.tolist(), data['px'][rows].tolist())]
+
+    def overlapping(self, left_rows, right_rows):
+        # sort-and-search broadphase on x, then the exact colliderect test on the candidate pairs
+        data = self.data
+        x, y, width, height = data['x'], data['y'], data['width'], data['height']
+        order = right_rows[np.argsort(x[right_rows], kind = 'stable')]
+        sorted_x = x[order]
+        widest = width[right_rows].max()
+        low = np.searchsorted(sorted_x, x[left_rows] - widest - 1, 'left')
+        high = np.searchsorted(sorted_x, x[left_rows] + width[left_rows], 'left')
+        counts = high - low
+        if not counts.sum():
+            return left_rows[:0], right_rows[:0]
+        lefts = np.repeat(left_rows, counts)
+        starts = np.repeat(low - (np.cumsum(counts) - counts), counts)
+        rights = order[starts + np.arange(counts.sum())]
+        hit = ((x[lefts] < x[rights] + width[rights]) & (x[lefts] + width[lefts] > x[rights])
+               & (y[lefts] < y[rights] + height[rights]) & (y[lefts] + height[lefts] > y[rights]))
+        return lefts[hit], rights[hit]
+
+    def colliding(self, player_rect):
+        """Sync and return (bullets touching an enemy, enemies touching a bullet, enemies touching the player)"""
+        data = self.data[:self.count]
+        if self.groups is None:
+            active, kind = data['active'], data['kind']
+            self.groups = np.flatnonzero(active & (kind == BULLET)), np.flatnonzero(active & (kind != BULLET))
+        bullets, enemies = self.groups
+        if not len(enemies):
+            return [], [], []
+
+        bullet_rows = enemy_rows = enemies[:0]
+        if len(bullets):
+            bullet_rows, enemy_rows = self.overlapping(bullets, enemies)
+            if len(bullet_rows):
+                bullet_rows, enemy_rows = np.unique(bullet_rows), np.unique(enemy_rows)
+
+        left, top, width, height = player_rect
+        x, y = data['x'][enemies], data['y'][enemies]
+        near = np.float32(left) + np.float32(width)
+        player_rows = enemies[(x < near) & (x + data['width'][enemies] > np.float32(left))
+                              & (y < np.float32(top) + np.float32(height)) & (y + data['height'][enemies] > np.float32(top))]
+
+        # most steps nothing touches anything, skip the set operations and the sync then
+        if len(bullet_rows):
+            rows = np.union1d(np.union1d(bullet_rows, enemy_rows), player_rows) if len(player_rows) else np.union1d(bullet_rows, enemy_rows)
+            self.sync(rows)
+        elif len(player_rows):
+            self.sync(player_rows)
+        else:
+            return [], [], []
+        sprites = self.sprites
+        return ([sprites[row] for row in bullet_rows.tolist()], [sprites[row] for row in enemy_rows.tolist()],
+                [sprites[row] for row in player_rows.tolist()])
@@ -0,0 +1,61 @@
+from settings import *
+from queue import Queue, Empty
+from threading import Thread
+
+class LevelLoader:
+    # builds the next level on a worker thread, the main thread only swaps the result in
+    def __init__(self, build):
+        self.build = build
+        self.results = Queue(maxsize = 1)
+        self.thread = None
+        self.level_num = None
+        self.progress = 0
+
+    @property
+    def busy(self):
+        return self.thread is not None
+
+    def start(self, level_num):
+        if self.busy and self.level_num == level_num:
+            return
+        self.cancel()
+        self.level_num = level_num
+        self.progress = 0
+        self.thread = Thread(target = self.run, args = (level_num,), daemon = True)
+        self.thread.start()
+
+    def run(self, level_num):
+        try:
+            result = self.build(level_num, self.set_progress)
+        except Exception as error:
+            result = error
+        self.results.put((level_num, result))
+
+    def set_progress(self, fraction):
+        self.progress = fraction
+
+    def cancel(self):
+        # a superseded build still has to finish before the next one can start
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        while not self.results.empty():
+            self.results.get_nowait()
+
+    def wait(self):
+        """Block until the worker is done and return its level"""
+        if self.thread is not None:
+            self.thread.join()
+        return self.poll()
+
+    def poll(self):
+        """Return the built level once the worker is done, None while it is still running"""
+        try:
+            level_num, result = self.results.get_nowait()
+        except Empty:
+            return None
+        self.thread.join()
+        self.thread = None
+        if isinstance(result, Exception):
+            raise result
+        return result
@@ -0,0 +1,227 @@
+from settings import *
+from array import array
+from collections import namedtuple
+from os import makedirs, remove, replace, stat
+from os.path import dirname, exists, normpath
+import xml.etree.ElementTree as ET
+import pickle
+import tempfile
+import zlib
+import pytmx
+from collision import merge_tiles
+from navigation import build_navigation, NavGraph
+
+CACHE_DIR = join('data', 'cache')
+CACHE_VERSION = 3
+ATLAS_WIDTH = 1024
+
+LevelObject = namedtuple('LevelObject', ('name', 'x', 'y', 'width', 'height', 'gid'))
+
+# (top, bottom) portal pairs per level, as the tile each 64px portal covers
+PORTALS = {
+    1: [((28, 12), (28, 48))],
+    2: [((45, 16), (15, 45))],
+    3: [((46, 31), (11, 48)), ((58, 43), (25, 32))],
+    5: [((56, 18), (16, 44))],
+}
+
+def level_path(level_num):
+    return join('data', 'maps', f'world{level_num}.tmx')
+
+def cache_path(level_num):
+    return join(CACHE_DIR, f'world{level_num}.lvl')
+
+def source_files(tmx_path):
+    # every file the compiled level depends on: the map, its .tsx/.tx files and the tileset images
+    files = [tmx_path]
+    map_dir = dirname(tmx_path)
+    root = ET.parse(tmx_path).getroot()
+    for tileset in root.iter('tileset'):
+        if 'source' in tileset.attrib:
+            tsx_path = normpath(join(map_dir, tileset.attrib['source']))
+            files.append(tsx_path)
+            for image in ET.parse(tsx_path).getroot().iter('image'):
+                files.append(normpath(join(dirname(tsx_path), image.attrib['source'])))
+        else:
+            for image in tileset.iter('image'):
+                files.append(normpath(join(map_dir, image.attrib['source'])))
+    for obj in root.iter('object'):
+        if 'template' in obj.attrib:
+            files.append(normpath(join(map_dir, obj.attrib['template'])))
+    return list(dict.fromkeys(files))
+
+def file_stamps(files):
+    stamps = {}
+    for path in files:
+        info = stat(path)
+        stamps[path] = (info.st_mtime_ns, info.st_size)
+    return stamps
+
+def is_stale(stamps):
+    for path, stamp in stamps.items():
+        if not exists(path):
+            return True
+        info = stat(path)
+        if (info.st_mtime_ns, info.st_size) != stamp:
+            return True
+    return False
+
+def write_cache(path, data):
+    # written next to the target and moved over it in one step, so a reader (or a batch worker
+    # compiling the same level) never sees a half written file
+    makedirs(dirname(path), exist_ok = True)
+    with tempfile.NamedTemporaryFile(dir = dirname(path), delete = False) as file:
+        try:
+            file.write(data)
+        except BaseException:
+            file.close()
+            remove(file.name)
+            raise
+    try:
+        replace(file.name, path)
+    except OSError:
+        remove(file.name)
+        raise
+
+def slice_tile(sheets, image_info):
+    # same slicing and flip handling as pytmx.util_pygame, but only for the tiles in use
+    path, rect, flags = image_info
+    if path not in sheets:
+        sheets[path] = pygame.image.load(path)
+    tile = sheets[path].subsurface(rect)
+    if flags.flipped_diagonally:
+        tile = pygame.transform.flip(pygame.transform.rotate(tile, 270), True, False)
+    if flags.flipped_horizontally or flags.flipped_vertically:
+        tile = pygame.transform.flip(tile, flags.flipped_horizontally, flags.flipped_vertically)
+    return tile
+
+def compile_level(level_num):
+    tmx_path = level_path(level_num)
+    tmx_map = pytmx.TiledMap(tmx_path) # default loader only records (path, rect, flags), nothing is decoded
+
+    # remap pytmx gids onto a dense atlas index, 0 stays empty
+    atlas_index = {}
+    def index_of(gid):
+        if gid not in atlas_index:
+            atlas_index[gid] = len(atlas_index) + 1
+        return atlas_index[gid]
+
+    layers = {}
+    objects = {}
+    for layer in tmx_map.layers:
+        if isinstance(layer, pytmx.TiledTileLayer):
+            data = array('H', bytes(2 * tmx_map.width * tmx_map.height))
+            for y, row in enumerate(layer.data):
+                for x, gid in enumerate(row):
+                    if gid:
+                        data[y * tmx_map.width + x] = index_of(gid)
+            layers[layer.name] = data.tobytes()
+        elif isinstance(layer, pytmx.TiledObjectGroup):
+            objects[layer.name] = [
+                (obj.name, obj.x, obj.y, obj.width, obj.height, index_of(obj.gid) if obj.gid else 0)
+                for obj in layer]
+
+    # solid 'Main' tiles merged into as few colliders as cover them
+    main = layers.get('Main')
+    colliders = merge_tiles(array('H', main), tmx_map.width, tmx_map.height) if main else []
+
+    # where enemies can walk, fall, jump and teleport to on the same tiles
+    solid = array('H', main or bytes(2 * tmx_map.width * tmx_map.height))
+    navigation = build_navigation(solid, tmx_map.width, tmx_map.height, PORTALS.get(level_num, []))
+
+    # shelf-pack the used tiles into one atlas
+    sheets = {}
+    tiles = [slice_tile(sheets, tmx_map.images[gid]) for gid in atlas_index]
+    rects = []
+    x = y = shelf_height = 0
+    for tile in tiles:
+        width, height = tile.get_size()
+        if x + width > ATLAS_WIDTH:
+            x, y, shelf_height = 0, y + shelf_height, 0
+        rects.append((x, y, width, height))
+        x += width
+        shelf_height = max(shelf_height, height)
+    atlas = pygame.Surface((ATLAS_WIDTH, max(y + shelf_height, 1)), pygame.SRCALPHA)
+    for tile, rect in zip(tiles, rects):
+        atlas.blit(tile, rect[:2])
+
+    compiled = {
+        'version': CACHE_VERSION,
+        'sources': file_stamps(source_files(tmx_path)),
+        'width': tmx_map.width,
+        'height': tmx_map.height,
+        'tile_size': tmx_map.tilewidth,
+        'layers': layers,
+        'objects': objects,
+        'colliders': colliders,
+        'navigation': navigation,
+        'atlas_size': atlas.get_size(),
+        'atlas': pygame.image.tobytes(atlas, 'RGBA'),
+        'atlas_rects': rects,
+    }
+    write_cache(cache_path(level_num), zlib.compress(pickle.dumps(compiled, pickle.HIGHEST_PROTOCOL)))
+    return compiled
+
+def read_compiled(level_num):
+    path = cache_path(level_num)
+    if exists(path):
+        try:
+            with open(path, 'rb') as file:
+                compiled = pickle.loads(zlib.decompress(file.read()))
+            # portals and player physics live in code, a change to them rebuilds the navigation too
+            navigation = compiled['navigation']
+            if (compiled['version'] == CACHE_VERSION and not is_stale(compiled['sources'])
+                    and navigation['portals'] == PORTALS.get(level_num, [])
+                    and navigation['physics'] == (PLAYER_SPEED, GRAVITY, JUMP_SPEED)):
+                return compiled
+        except Exception:
+            # unreadable or from an older layout, either way a miss
+            pass
+    return compile_level(level_num)
+
+class LevelData:
+    def __init__(self, compiled):
+        self.width = compiled['width']
+        self.height = compiled['height']
+        self.tile_size = compiled['tile_size']
+        self.layers = {name: array('H', data) for name, data in compiled['layers'].items()}
+        self.object_layers = {name: [LevelObject(*obj) for obj in layer] for name, layer in compiled['objects'].items()}
+        self.colliders = compiled['colliders'] # (x, y, width, height) in tiles
+        self.portals = compiled['navigation']['portals']
+        self.navigation = NavGraph(compiled['navigation'])
+
+        atlas = pygame.image.frombytes(compiled['atlas'], compiled['atlas_size'], 'RGBA').convert_alpha()
+        self.images = [None] + [atlas.subsurface(rect) for rect in compiled['atlas_rects']]
+
+    def get_tile_image_by_gid(self, gid):
+        return self.images[gid]
+
+    def tiles(self, layer_name):
+        # same (x, y, image) rows as pytmx's layer.tiles(), raises ValueError for a missing layer
+        if layer_name not in self.layers:
+            raise ValueError(f'Layer "{layer_name}" not found.')
+        data, width, images = self.layers[layer_name], self.width, self.images
+        for i, index in enumerate(data):
+            if index:
+                yield i % width, i // width, images[index]
+
+    def objects(self, layer_name):
+        if layer_name not in self.object_layers:
+            raise ValueError(f'Layer "{layer_name}" not found.')
+        return self.object_layers[layer_name]
+
+def load_level_data(level_num):
+    return LevelData(read_compiled(level_num))
+
+if __name__ == '__main__':
+    # precompile every map, run from the project root: python code/levels.py
+    level_num = 1
+    while exists(level_path(level_num)):
+        compiled = compile_level(level_num)
+        solid = sum(1 for index in array('H', compiled['layers'].get('Main', b'')) if index)
+        colliders = len(compiled['colliders'])
+        navigation = compiled['navigation']
+        print(f'world{level_num}: {len(compiled["atlas_rects"])} tiles in atlas, {len(compiled["sources"])} source files, '
+              f'{solid} solid tiles merged into {colliders} colliders ({1 - colliders / max(solid, 1):.0%} fewer), '
+              f'{len(navigation["nodes"])} navigation nodes with {len(navigation["links"])} links')
+        level_num += 1
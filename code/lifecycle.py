@@ -0,0 +1,90 @@
+from settings import *
+from collections import deque
+from timer import Timer
+
+class Lifecycle:
+    # spawned entities per kind: where they may live, how many of them may live at once and
+    # how many did over time. Leaving the world bounds is checked every step by the sprites
+    # themselves (despawn spans), distance from the player by a periodic sweep
+    def __init__(self, caps = POPULATION_CAPS, margin = DESPAWN_MARGIN, distances = DESPAWN_DISTANCES):
+        self.caps = caps
+        self.margin = margin
+        self.distances = distances
+        self.bounds = pygame.FRect()
+        self.anchor = None # distances are measured from this sprite, the player
+        self.totals = {} # name: group counted alongside the tracked kinds
+        self.live = {} # kind: group of live tracked sprites, killed sprites leave it by themselves
+        self.history = deque(maxlen = LIFECYCLE_SAMPLES) # (seconds into the level, counts)
+        self.timer = None
+        self.started = 0
+        self.stats = {'spawned': {}, 'capped': {}, 'culled': {}, 'peak': {}}
+
+    def start(self, world_rect, anchor, totals):
+        """Begin a level: new bounds and anchor, empty populations"""
+        self.bounds = pygame.FRect(world_rect).inflate(self.margin * 2, self.margin * 2)
+        self.anchor = anchor
+        self.totals = totals
+        for group in self.live.values():
+            group.empty()
+        self.history.clear()
+        if self.timer:
+            self.timer.cancel()
+        self.timer = Timer(LIFECYCLE_SWEEP, func = self.sweep, autostart = True, repeat = True)
+        self.started = self.timer.start_time
+
+    def can_spawn(self, kind):
+        if len(self.live.get(kind, ())) < self.caps.get(kind, float('inf')):
+            return True
+        self.count('capped', kind)
+        return False
+
+    def track(self, kind, sprite):
+        if kind not in self.live:
+            self.live[kind] = pygame.sprite.Group()
+        self.live[kind].add(sprite)
+        self.count('spawned', kind)
+        return sprite
+
+    def count(self, stat, kind, amount = 1):
+        self.stats[stat][kind] = self.stats[stat].get(kind, 0) + amount
+
+    def sweep(self):
+        # drop tracked sprites too far from the anchor, then sample the populations
+        for kind, distance in self.distances.items():
+            if kind not in self.live or self.anchor is None:
+                continue
+            keep = self.anchor.rect.inflate(distance * 2, distance * 2)
+            sprites = self.live[kind].sprites()
+            batched = [sprite for sprite in sprites if sprite.bodies]
+            if batched:
+                batched[0].bodies.sync_sprites(batched) # batched rects are only written back on demand
+            for sprite in sprites:
+                if not keep.colliderect(sprite.rect):
+                    sprite.kill()
+                    self.count('culled', kind)
+
+        counts = self.counts()
+        for kind, live in counts.items():
+            self.stats['peak'][kind] = max(self.stats['peak'].get(kind, 0), live)
+        self.history.append(((self.timer.scheduler.now - self.started) / 1000, counts))
+
+    def counts(self):
+        counts = {kind: len(group) for kind, group in self.live.items()}
+        counts.update((name, len(group)) for name, group in self.totals.items())
+        return counts
+
+    def leaking(self):
+        """Kinds whose population floor kept rising over a full sample window"""
+        if len(self.history) < self.history.maxlen:
+            return []
+        half = len(self.history) // 2
+        samples = [counts for _, counts in self.history]
+        kinds = set().union(*samples)
+        return sorted(kind for kind in kinds
+                      if min(counts.get(kind, 0) for counts in samples[half:]) > max(counts.get(kind, 0) for counts in samples[:half]))
+
+    def report(self, history = False):
+        report = {'live': self.counts(), **self.stats, 'leaking': self.leaking()}
+        if history:
+            report['history'] = list(self.history)
+        return report
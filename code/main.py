@@ -1,20 +1,59 @@
 from settings import * 
 from sprites import *
-from groups import AllSprites
+from groups import AllSprites, CollectibleSprites
 from popuptext import *
 import os
 import pygame._sdl2 as sdl2
 import pygame.display
 from support import *
-from random import randint
+from collision import TileGrid
+from level_loader import LevelLoader
+from hud import Hud
+from broadphase import SweepAndPrune
+from profiler import PhaseProfiler
+from pools import SpritePool
+from atlas import load_atlas
+from assets import AssetManager
+from inputs import KeyboardInput, RandomInput
+from screens import ScreenUpdates
+from lifecycle import Lifecycle
+from parallax import Parallax
+from replay import Recorder, ReplayInput
+from timer import get_ticks, set_time_source, scheduler
+import argparse
+import time
+import zlib
+from random import Random, randrange
 import pytmx
 import sys
 
 class Game:
-    def __init__(self):
+    def __init__(self, headless = False, input_source = None, seed = None):
         print("Starting platform game!")
-        os.environ['SDL_VIDEO_DISPLAY'] = '1'
-        os.environ['SDL_VIDEO_WINDOW_POS'] = '1920,0'	
+        self.headless = headless
+        if headless:
+            # no window and no audio device
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+            os.environ['SDL_AUDIODRIVER'] = 'dummy'
+        else:
+            os.environ['SDL_VIDEO_DISPLAY'] = '1'
+            os.environ['SDL_VIDEO_WINDOW_POS'] = '1920,0'	
+        self.input_source = input_source or KeyboardInput()
+
+        # the game clock only moves by the frame or step times fed in, so a recorded session replays exactly
+        self.sim_ticks = 1
+        set_time_source(lambda: self.sim_ticks)
+
+        # every gameplay random number comes from here
+        self.seed = seed if seed is not None else randrange(2 ** 32)
+        self.rng = Random(self.seed)
+        self.recorder = None
+        self.playback = None
+        self.frame_state = None # the state the last frame's state machine ran in
+
+        # gameplay timers run on the scheduler's clock, frozen outside 'playing'
+        self.scheduler = scheduler
+        self.scheduler.reset()
 
         pygame.init()
         try:
@@ -27,10 +66,16 @@ class Game:
         
         self.display_surface = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
         pygame.display.set_caption('Platformer')
+        self.screen = ScreenUpdates(self.display_surface)
+
+        # every sprite and UI image, pre-scaled and packed into cached atlas pages
+        self.atlas = load_atlas()
+        self.assets = AssetManager(self.atlas)
 
-        # BG
-        self.background = pygame.image.load('data/graphics/bg2.png').convert()
-        self.background = pygame.transform.scale(self.background, (WINDOW_WIDTH, WINDOW_HEIGHT))
+        # BG, the menu's backdrop and each level's scrolling scenery; headless runs skip the scenery
+        self.background = self.atlas.image('background')
+        self.show_parallax = PARALLAX and not headless
+        self.parallax = Parallax()
 
         self.SPAWN_MARGIN = 10 * TILE_SIZE
         self.PLAYABLE_HEIGHT = 40 * TILE_SIZE
@@ -38,18 +83,36 @@ class Game:
 
         # game states and clock
         self.clock = pygame.time.Clock()
-        self.game_state = 'menu'
+        self.game_state = 'playing' if headless else 'menu'
         self.running = True
         self.current_level = 1
         self.total_levels = 6
         self.level_loaded = False
         self.show_inventory = False
+        self.menu_hover = {} # button label: hovered when last drawn
         self.popup_system = PopupText(self.display_surface, self.font)
         self.shop = None
         self.show_shop = False
         self.shop_interaction_cooldown = Timer(500)
         self.level_start_coins = 0
         self.death_total = 0
+
+        # fixed-step simulation: rendered frames feed real time in, physics consumes it in PHYSICS_DT steps
+        self.accumulator = 0
+        self.dropped_steps = 0
+
+        # recycled short-lived sprites
+        self.pools = {
+            'bullet': SpritePool(Bullet, POOL_SIZES['bullet']),
+            'fire': SpritePool(Fire, POOL_SIZES['fire']),
+            'bee': SpritePool(Bee, POOL_SIZES['bee']),
+        }
+
+        # despawn policy, population caps and live counts for spawned entities
+        self.lifecycle = Lifecycle()
+
+        # per-phase frame timings, F3 toggles the overlay
+        self.profiler = PhaseProfiler()
         self.level_start_points = 0 
 
         # transition values
@@ -57,80 +120,51 @@ class Game:
         self.transition_duration = 3000
         self.fade_alpha = 0
         self.fade_direction = 1
+        self.loading_text = self.loading_rect = None
+        self.level_loader = LevelLoader(self.build_level)
+        self.preloaded_level = None
 
         # groups 
         self.all_sprites = AllSprites()
-        self.collision_sprites = pygame.sprite.Group()
-        self.collectible_sprites = pygame.sprite.Group()
+        self.collectible_sprites = CollectibleSprites()
         self.bullet_sprites = pygame.sprite.Group()
         self.enemy_sprites = pygame.sprite.Group()
         self.trader_sprites = pygame.sprite.Group()
+        self.broadphase = SweepAndPrune()
 
         self.load_assets()
+        self.hud = Hud(self)
 
     def create_bee(self):
+        if not self.lifecycle.can_spawn('bee'):
+            return
         spawn_x = self.SPAWN_MARGIN + self.PLAYABLE_WIDTH
-        random_tile_position = randint(0, self.PLAYABLE_HEIGHT // 64)
+        random_tile_position = self.rng.randint(0, self.PLAYABLE_HEIGHT // 64)
 
         spawn_y = (random_tile_position * 64) + self.SPAWN_MARGIN
-        Bee(frames = self.bee_frames,
+        self.lifecycle.track('bee', self.pools['bee'].acquire(
+            frames = self.assets.frames('bee'),
             pos = (spawn_x, spawn_y),
             groups = (self.all_sprites, self.enemy_sprites),
-            speed = randint(100, 300))
+            speed = self.rng.randint(100, 300),
+            bounds = self.lifecycle.bounds,
+            rng = self.rng))
 
     def create_bullet(self, pos, direction):
-        x = pos[0] + direction * 34 if direction == 1 else pos[0] + direction * 34 - self.bullet_surf.get_width()
-        Bullet(self.bullet_surf, (x, pos[1]), direction, (self.all_sprites, self.bullet_sprites), self.level_width)
-        Fire(self.fire_surf, pos, self.all_sprites, self.player)
+        bullet_frames = self.assets.frames('bullet')
+        x = pos[0] + direction * 34 if direction == 1 else pos[0] + direction * 34 - bullet_frames[0].get_width()
+        self.lifecycle.track('bullet', self.pools['bullet'].acquire((self.all_sprites, self.bullet_sprites),
+            frames = bullet_frames, pos = (x, pos[1]), direction = direction, bounds = self.lifecycle.bounds))
+        self.lifecycle.track('fire', self.pools['fire'].acquire(self.all_sprites, frames = self.assets.frames('fire'), pos = pos, player = self.player))
 
     def load_assets(self):
-        self.v_icon = import_image('data', 'graphics', 'V')
-        self.diamond_frames = import_folder('images', 'collectibles', 'diamond')
-        self.health_potion_icon = import_image('images', 'collectibles','health_potion', '09')
-        self.health_potion_frames = import_folder('images', 'collectibles', 'health_potion')
-        self.player_frames = import_folder('images', 'player')
-        self.bullet_surf = import_image('images', 'gun', 'bullet')
-        self.fire_surf = import_image('images', 'gun', 'fire')
-        self.bee_frames = import_folder('images', 'enemies', 'bee')
-        self.worm_frames = import_folder('images', 'enemies', 'worm')
-        self.coin_frames = import_folder('images', 'collectibles', 'coin')
-        self.trader_frames = import_folder('images', 'friendly', 'trader')
-        scaled_frames = []
-        for frame in self.trader_frames:
-            scaled = pygame.transform.scale_by(frame, 1.5)
-            scaled_frames.append(scaled)
-        self.trader_frames = scaled_frames
-
-        self.ui_assets = {
-            # Static UI frames
-            'inventory': import_image('images', 'ui', 'inventory'),
-            'score_panel': import_image('images', 'ui', 'score_backdrop'),
-            'status_scroll': import_image('images', 'ui', 'banner'),
-            'shop_ui': import_image('images', 'ui', 'shop_inv1'),
-            'dialogue': import_image('images', 'ui', 'dialogue'),
-        }
+        # sprite frame sets are built per level by self.assets
+        atlas = self.atlas
+        self.v_icon = atlas.image('v_icon')
+        self.health_potion_icon = atlas.image('health_potion_icon')
 
-        # Scale UI elements to desired sizes
-        self.ui_assets['inventory'] = pygame.transform.scale(
-            self.ui_assets['inventory'],
-            (100, 300)
-        )
-        self.ui_assets['score_panel'] = pygame.transform.scale(
-            self.ui_assets['score_panel'],
-            (290, 200)
-        )
-        self.ui_assets['status_scroll'] = pygame.transform.scale(
-            self.ui_assets['status_scroll'],
-            (400, 80)
-        )
-        self.ui_assets['shop_ui'] = pygame.transform.scale(
-            self.ui_assets['shop_ui'],
-            (800, 800)
-        )
-        self.ui_assets['dialogue'] = pygame.transform.scale(
-            self.ui_assets['dialogue'],
-            (300, 150)
-        )
+        # Static UI frames, baked at their display sizes
+        self.ui_assets = {name: atlas.image(name) for name in ('inventory', 'score_panel', 'status_scroll', 'shop_ui', 'dialogue')}
         self.popup_system.add_popup_image('status_scroll', self.ui_assets['status_scroll'])
         self.popup_system.add_popup_image('shop_ui', self.ui_assets['shop_ui'])
         self.popup_system.add_popup_image('dialogue', self.ui_assets['dialogue'])
@@ -140,25 +174,45 @@ class Game:
         # self.audio['music'].play()
 
     def handle_shop_input(self):
-        keys = pygame.key.get_pressed()
+        keys = self.input_source.get_pressed()
         if keys[pygame.K_ESCAPE] and self.show_shop:
             self.show_shop = False
             return
+        trader_colliding = None # nothing moves in between, so one mask test serves both checks
         if keys[pygame.K_e] and not self.shop_interaction_cooldown.active:
             trader_colliding = pygame.sprite.spritecollide(self.player, self.trader_sprites, False, pygame.sprite.collide_mask)
             if trader_colliding and not self.show_shop:
                 self.show_shop = True
                 self.shop_interaction_cooldown.activate()
         if self.show_shop:
-            trader_colliding = pygame.sprite.spritecollide(self.player, self.trader_sprites, False, pygame.sprite.collide_mask)
+            if trader_colliding is None:
+                trader_colliding = pygame.sprite.spritecollide(self.player, self.trader_sprites, False, pygame.sprite.collide_mask)
             if not trader_colliding:
                 self.show_shop = False
 
-    def setup (self, level_num):
-        self.level_num = level_num
-        tmx_map = load_pygame(join('data', 'maps', f'world{self.level_num}.tmx'))
-        self.level_width = tmx_map.width * TILE_SIZE
-        self.level_height = tmx_map.height * TILE_SIZE
+    def build_level(self, level_num, progress = None):
+        """Build a level's sprites into fresh groups, safe to run off the main thread"""
+        report = progress or (lambda fraction: None)
+        report(0)
+        # its own random stream, so a build on the loader thread never interleaves with the game's
+        rng = Random(f'{self.seed}:{level_num}')
+        level_data = self.assets.level_data(level_num)
+        report(0.3)
+
+        level = {
+            'level_num': level_num,
+            'level_width': level_data.width * TILE_SIZE,
+            'level_height': level_data.height * TILE_SIZE,
+            'all_sprites': AllSprites(),
+            'collectible_sprites': CollectibleSprites(),
+            'bullet_sprites': pygame.sprite.Group(),
+            'enemy_sprites': pygame.sprite.Group(),
+            'trader_sprites': pygame.sprite.Group(),
+            'player': None,
+            'assets': self.assets.level_keys(level_num, level_data),
+        }
+        all_sprites = level['all_sprites']
+        frames = {key[1]: self.assets.frames(key[1]) for key in level['assets'] if key[0] == 'frames'}
         
         # Portal Surfaces
         portal_surf = pygame.Surface((64, 64))
@@ -167,124 +221,150 @@ class Game:
         portal2_surf.fill('red')
 
         # Portal Spawning
-        if self.current_level == 1:
-            portal_x = (18 + 10) * TILE_SIZE
-            top_y = (2 + 10) * TILE_SIZE
-            bottom_y = (38 + 10) * TILE_SIZE
-            self.top_portal = Portal((portal_x, top_y), portal_surf, [self.all_sprites], 'top')
-            self.bottom_portal = Portal((portal_x, bottom_y), portal_surf, [self.all_sprites], 'bottom')
-            self.top_portal_two = None
-            self.bottom_portal_two = None
-
-        elif self.current_level ==2:
-            top_x = (35 + 10) * TILE_SIZE
-            top_y = (6 + 10) * TILE_SIZE
-            bottom_x = (5 + 10) * TILE_SIZE
-            bottom_y = (35 + 10) * TILE_SIZE
-            self.top_portal = Portal((top_x, top_y), portal_surf, [self.all_sprites], 'top')
-            self.bottom_portal = Portal((bottom_x, bottom_y), portal_surf, [self.all_sprites], 'bottom')
-            self.top_portal_two = None
-            self.bottom_portal_two = None
-
-        elif self.current_level == 3:
-            top_x = (46) * TILE_SIZE
-            top_y = (31) * TILE_SIZE
-            bottom_x = (11) * TILE_SIZE
-            bottom_y = (48) * TILE_SIZE
-            self.top_portal = Portal((top_x, top_y), portal_surf, [self.all_sprites], 'top')
-            self.bottom_portal = Portal((bottom_x, bottom_y), portal_surf, [self.all_sprites], 'bottom')
-            top_x2 = (58) * TILE_SIZE
-            top_y2 = (43) * TILE_SIZE
-            bottom_x2 = (25) * TILE_SIZE
-            bottom_y2 = (32) * TILE_SIZE
-            self.top_portal_two = Portal((top_x2, top_y2), portal2_surf, [self.all_sprites], 'top')
-            self.bottom_portal_two = Portal((bottom_x2, bottom_y2), portal2_surf, [self.all_sprites], 'bottom')
-        
-        elif self.current_level == 5:
-            level5_portal_surf = portal_surf.copy()
-            level5_portal_surf.set_alpha(64)
-            top_x = (56) * TILE_SIZE
-            top_y = (18) * TILE_SIZE
-            bottom_x = (16) * TILE_SIZE
-            bottom_y = (44) * TILE_SIZE
-            self.top_portal = Portal((top_x, top_y), level5_portal_surf, [self.all_sprites], 'top')
-            self.bottom_portal = Portal((bottom_x, bottom_y), level5_portal_surf, [self.all_sprites], 'bottom')
-            self.top_portal_two = None
-            self.bottom_portal_two = None
+        if level_num == 5:
+            portal_surf.set_alpha(64)
+        portals = [(Portal((top[0] * TILE_SIZE, top[1] * TILE_SIZE), surf, [], 'top'),
+                    Portal((bottom[0] * TILE_SIZE, bottom[1] * TILE_SIZE), surf, [], 'bottom'))
+                   for (top, bottom), surf in zip(level_data.portals, (portal_surf, portal2_surf))]
+        top_portal, bottom_portal = portals[0] if portals else (None, None)
+        top_portal_two, bottom_portal_two = portals[1] if len(portals) > 1 else (None, None)
+
+        level['top_portal'] = top_portal
+        level['bottom_portal'] = bottom_portal
+        level['top_portal_two'] = top_portal_two
+        level['bottom_portal_two'] = bottom_portal_two
+        level['navigation'] = level_data.navigation
+
+        level['parallax'] = Parallax(self.assets.background_layers(level_num, level_data) if self.show_parallax else ())
+
+        collision_grid = TileGrid(level_data.width, level_data.height)
+        for rect in level_data.colliders:
+            collision_grid.add_rect(*rect)
+        level['collision_grid'] = collision_grid
+
+        def bake():
+            # static layers, baked bottom to top: portals, 'Main', 'Decoration', 'Decoration FG'
+            for portal in (top_portal, bottom_portal, top_portal_two, bottom_portal_two):
+                if portal is not None:
+                    all_sprites.add_static(portal.rect.topleft, portal.image)
+
+            for x, y, image in level_data.tiles('Main'):
+                all_sprites.add_static((x * TILE_SIZE, y * TILE_SIZE), image)
+
+            for x, y, image in level_data.tiles('Decoration'):
+                all_sprites.add_static((x * TILE_SIZE, y * TILE_SIZE), image)
             
-        else:
-            self.top_portal = None
-            self.bottom_portal = None
-            self.top_portal_two = None
-            self.bottom_portal_two = None
-
-        for x, y, image in tmx_map.get_layer_by_name('Main').tiles():
-            Sprite((x * TILE_SIZE, y * TILE_SIZE), image, (self.all_sprites, self.collision_sprites))
-
-        for x, y, image in tmx_map.get_layer_by_name('Decoration').tiles():
-            Sprite((x * TILE_SIZE, y * TILE_SIZE), image, (self.all_sprites))
-        
-        try:
-            for x, y, image in tmx_map.get_layer_by_name('Decoration FG').tiles():
-                Sprite((x * TILE_SIZE, y * TILE_SIZE), image, (self.all_sprites))
-        except ValueError:
-            pass
-
-        previous_points = 0
-        previous_kills = 0
-        if hasattr(self, 'player'):
-            previous_points = self.player.points
-            previous_kills = self.player.kills
-        for obj in tmx_map.get_layer_by_name('Entities'):
+            try:
+                for x, y, image in level_data.tiles('Decoration FG'):
+                    all_sprites.add_static((x * TILE_SIZE, y * TILE_SIZE), image)
+            except ValueError:
+                pass
+            report(0.4)
+            all_sprites.bake_static(lambda fraction: report(0.4 + fraction * 0.5))
+            return all_sprites.chunks
+        # chunks are never drawn into after baking, so a warm level shares them
+        all_sprites.chunks = self.assets.chunks(level_num, bake)
+
+        player = None
+        for obj in level_data.objects('Entities'):
             
             if obj.name == 'Player':
-                self.player = Player(
+                player = Player(
                     (obj.x, obj.y),
-                    self.all_sprites,
-                    self.collision_sprites,
-                    self.collectible_sprites,
-                    self.player_frames,
+                    all_sprites,
+                    collision_grid,
+                    level['collectible_sprites'],
+                    frames['player'],
                     self.create_bullet,
-                    self.top_portal,
-                    self.bottom_portal,
-                    self.top_portal_two,
-                    self.bottom_portal_two,
-                    self.display_surface
+                    top_portal,
+                    bottom_portal,
+                    top_portal_two,
+                    bottom_portal_two,
+                    self.display_surface,
+                    self.input_source
                     )
-                # Restore previous stats
-                self.player.points = previous_points
-                self.player.kills = previous_kills
+                level['player'] = player
 
             if obj.name == 'Cherry':  # Or whatever you named your objects in Tiled
-                cherry_image = tmx_map.get_tile_image_by_gid(obj.gid)
-                Cherry((obj.x, obj.y), cherry_image, [self.all_sprites, self.collectible_sprites])
-                self.player.total_cherries += 1
+                cherry_image = level_data.get_tile_image_by_gid(obj.gid)
+                Cherry((obj.x, obj.y), cherry_image, [all_sprites, level['collectible_sprites']])
+                player.total_cherries += 1
             
             if obj.name == 'Worm':
-                Worm(self.worm_frames, pygame.FRect(obj.x, obj.y, obj.width, obj.height), (self.all_sprites, self.enemy_sprites))
+                Worm(frames['worm'], pygame.FRect(obj.x, obj.y, obj.width, obj.height), (all_sprites, level['enemy_sprites']), rng)
             
             if obj.name == 'Coin':
-                Coin(self.coin_frames, pygame.FRect(obj.x, obj.y - 2, obj.width, obj.height), (self.all_sprites, self.collectible_sprites))
-                self.player.total_coins += 1
+                Coin(frames['coin'], pygame.FRect(obj.x, obj.y - 2, obj.width, obj.height), (all_sprites, level['collectible_sprites']))
+                player.total_coins += 1
             
             if obj.name == 'Health_Potion':
-                Health_Potion(self.health_potion_frames, pygame.FRect(obj.x, obj.y - 12, obj.width, obj.height), (self.all_sprites, self.collectible_sprites))
-                self.player.total_health_pots += 1
+                Health_Potion(frames['health_potion'], pygame.FRect(obj.x, obj.y - 12, obj.width, obj.height), (all_sprites, level['collectible_sprites']))
+                player.total_health_pots += 1
             
             if obj.name == 'Diamond':
-                Diamond(self.diamond_frames, pygame.FRect(obj.x, obj.y, obj.width, obj.height), (self.all_sprites, self.collectible_sprites))
-                self.player.total_diamonds += 1
+                Diamond(frames['diamond'], pygame.FRect(obj.x, obj.y, obj.width, obj.height), (all_sprites, level['collectible_sprites']))
+                player.total_diamonds += 1
 
             if obj.name == 'Trader':
-                Trader(self.trader_frames, (obj.x - 44, obj.y - 95), (self.all_sprites, self.trader_sprites))
+                Trader(frames['trader'], (obj.x - 44, obj.y - 95), (all_sprites, level['trader_sprites']))
             
-        self.shop = Shop(self)
+        level['shop'] = Shop(self)
+        report(1)
+        return level
+
+    def swap_level(self, level):
+        """Swap a built level in on the main thread"""
+        previous_points = 0
+        previous_kills = 0
+        if hasattr(self, 'player'):
+            self.level_start_points += self.player.points
+            self.level_start_coins += self.player.coins
+            previous_points = self.player.points
+            previous_kills = self.player.kills
+
+        self.level_num = level['level_num']
+        self.level_width = level['level_width']
+        self.level_height = level['level_height']
+        self.all_sprites = level['all_sprites']
+        self.collectible_sprites = level['collectible_sprites']
+        self.bullet_sprites = level['bullet_sprites']
+        self.enemy_sprites = level['enemy_sprites']
+        self.trader_sprites = level['trader_sprites']
+        self.collision_grid = level['collision_grid']
+        self.navigation = level['navigation']
+        self.parallax = level['parallax']
+        self.top_portal = level['top_portal']
+        self.bottom_portal = level['bottom_portal']
+        self.top_portal_two = level['top_portal_two']
+        self.bottom_portal_two = level['bottom_portal_two']
+        self.shop = level['shop']
+        self.player = level['player']
+
+        # Restore previous stats
+        self.player.points = previous_points
+        self.player.kills = previous_kills
+
+        self.lifecycle.start((0, 0, self.level_width, self.level_height), self.player,
+                             {'sprites': self.all_sprites, 'enemies': self.enemy_sprites})
+
+        # the old level's spawner would otherwise keep firing on the shared scheduler
+        if hasattr(self, 'bee_timer'):
+            self.bee_timer.cancel()
+        self.bee_timer = Timer(1000, func = self.create_bee, autostart = True, repeat = True)
+        self.dialogue_timer = Timer(3000)
+        self.level_loaded = True
+        self.accumulator = 0 # don't try to catch up on the time spent loading
+        self.assets.activate(level['assets'])
 
         
     def collision(self):
+        # only sprites that can touch something, batched bodies are synced for these
+        player_reach = self.player.rect.union(pygame.FRect(self.player.rect.topleft, self.player.mask.get_size()))
+        bullets, enemies, enemies_near_player = self.all_sprites.collision_candidates(self.bullet_sprites, self.enemy_sprites, player_reach)
+
         # bullets -> enemies
-        for bullet in self.bullet_sprites:
-            sprite_collision = pygame.sprite.spritecollide(bullet, self.enemy_sprites, False, pygame.sprite.collide_mask)
+        bullet_hits = self.broadphase.collide(bullets, enemies, sizes = (len(self.bullet_sprites), len(self.enemy_sprites)))
+        for bullet, sprite_collision in bullet_hits.items():
             if sprite_collision:
                 bullet.kill()
                 for sprite in sprite_collision:
@@ -293,7 +373,7 @@ class Game:
                     self.player.points += 250
 
         # enemies -> player
-        collision_sprites = pygame.sprite.spritecollide(self.player, self.enemy_sprites, False, pygame.sprite.collide_mask)
+        collision_sprites = pygame.sprite.spritecollide(self.player, enemies_near_player, False, pygame.sprite.collide_mask)
         for enemy in collision_sprites:
             if not enemy.is_dying:
                 if isinstance(enemy, Bee):
@@ -315,153 +395,148 @@ class Game:
                 break
 
     def display_score_area(self):
-        x, y = 10, 10
-
-        self.display_surface.blit(self.ui_assets['score_panel'], (x, y))
-        score_x = x + 35
-        score_y = y + 15
-
-        self.display_coins(score_x, score_y)
-
-
-    def display_coins(self, x, y):
-        if self.player.coins == self.player.total_coins:
-            color = (76, 153, 0)  # Green
-        else:
-            color = (0, 0, 0)    # Black
-        coins_text = self.font.render(f'Coins: {self.player.coins} / {self.player.total_coins}', True, color)
-        coins_rect = coins_text.get_rect(topleft = (x, y))
-        self.display_surface.blit(coins_text, coins_rect)
-        self.display_diamonds(coins_rect)
-
-    def display_diamonds(self, coins_rect):
-        if self.player.diamonds == self.player.total_diamonds:
-            color = (76, 153, 0)  # Green
-        else:
-            color = (0, 0, 0)    # Black
-        diamonds_text = self.font.render(f'Diamonds: {self.player.diamonds} / {self.player.total_diamonds}', True, color)
-        diamonds_rect = diamonds_text.get_rect(topleft = (20, coins_rect.bottom + 10))
-        self.display_surface.blit(diamonds_text, diamonds_rect)
-        self.display_kills(diamonds_rect)
-
-    def display_kills(self, diamonds_rect):
-        kill_text = self.font.render(f'Kills: {self.player.kills}', True, (0,0,0))
-        kill_rect = kill_text.get_rect(topleft = (20, diamonds_rect.bottom + 10))
-        self.display_surface.blit(kill_text, kill_rect)
-        self.display_score_total(kill_rect)
-    
-    def display_score_total(self, kill_rect):
-        score_total_text = self.font.render(f'Score: {self.player.points}', True, (0, 0, 0))
-        score_total_rect = score_total_text.get_rect(topleft = (20, kill_rect.bottom + 10))
-        self.display_surface.blit(score_total_text, score_total_rect)
-        self.display_health(score_total_rect)
-    
-    def display_health(self, score_total_rect):
-        if self.player.health < 50:
-            color = (255, 0, 0)  # Red
-        elif self.player.health == 100:
-            color = (76, 153, 0)  # Green
-        else:
-            color = (0, 0, 0)    # Black
-        health_text = self.font.render(f'Health: {self.player.health}', True, color)
-        health_rect = health_text.get_rect(topleft = (30, score_total_rect.bottom + 10))
-        self.display_surface.blit(health_text, health_rect)
-        self.display_health_potions()
-        self.display_level(health_rect)
-
-    def display_level(self, health_rect):
-        color = (0, 0, 0)    # Black
-        level_text = self.font.render(f'Level: {self.current_level} / {self.total_levels}', True, color)
-        level_rect = level_text.get_rect(topleft = (30, health_rect.bottom + 10))
-        self.display_surface.blit(level_text, level_rect)
-        self.display_total_coins(level_rect)
-    
-    def display_total_coins(self, level_rect):
-        color = (0, 0, 0)    # Black
-        total_coins_text = self.font.render(f'Total Coins: {self.level_start_coins + self.player.coins}', True, color)
-        total_coins_rect = total_coins_text.get_rect(topleft = (30, level_rect.bottom + 10))
-        self.display_surface.blit(total_coins_text, total_coins_rect)
-
-    def display_health_potions(self):
-        inventory_x = 20
-        inventory_y = 300
-        
-        self.display_surface.blit(self.ui_assets['inventory'], (inventory_x, inventory_y))
-        
-        potion_x = inventory_x + 25
-        potion_y = inventory_y + 30
-        self.display_surface.blit(self.health_potion_icon, (potion_x, potion_y))
-        
-        count_x = potion_x + 40
-        count_y = potion_y + 10
-        potion_count_text = self.font.render(str(self.player.health_pots), True, BG_WHITE)
-        potion_count_text2 = self.font.render(str(self.player.health_pots), True, '#000000')
-        self.display_surface.blit(potion_count_text2, (count_x + 1, count_y + 1))
-        self.display_surface.blit(potion_count_text, (count_x, count_y))
-        
-        v_x = potion_x + 75
-        v_y = potion_y + 10
-        self.display_surface.blit(self.v_icon, (v_x, v_y))
+        self.hud.draw()
 
     def run(self):
         
         while self.running:
-            dt = self.clock.tick(FRAMERATE) / 1000 
+            dt_ms = self.clock.tick(FRAMERATE if self.game_state in ('playing', 'level_transition') else IDLE_FRAMERATE)
+            self.input_source.advance()
 
-            # Handle all events in one place
+            # Handle all events in one place, keys the state machine acts on are passed on as presses
+            presses = set()
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     self.running = False
                 elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_p:
-                        if self.game_state == 'playing':
-                            self.game_state = 'paused'
-                        elif self.game_state == 'paused':
-                            self.game_state = 'playing'
-                    elif event.key == pygame.K_RETURN:
-                        if self.game_state == 'menu':
-                            self.game_state = 'playing'
-                    elif event.key == pygame.K_COMMA and self.game_state == 'playing':
-                        self.current_level += 1
-                        self.start_level_transition()
-                    elif event.key == pygame.K_1 and self.game_state == 'playing':
-                        self.current_level = 1
-                        self.start_level_transition()
-                    elif event.key == pygame.K_2 and self.game_state == 'playing':
-                        self.current_level = 2
-                        self.start_level_transition()
-                    elif event.key == pygame.K_3 and self.game_state == 'playing':
-                        self.current_level = 3
-                        self.start_level_transition()
-                    elif event.key == pygame.K_4 and self.game_state == 'playing':
-                        self.current_level = 4
-                        self.start_level_transition()
-                    elif event.key == pygame.K_5 and self.game_state == 'playing':
-                        self.current_level = 5
-                        self.start_level_transition()
-            
-            keys = pygame.key.get_pressed()
-            if keys[pygame.K_c] and keys[pygame.K_LCTRL]:
-                self.running = False
-
-            # State machine
-            if self.game_state == 'menu':
-                self.run_menu()
-            elif self.game_state == 'playing':
-                self.run_game(dt, self.current_level)
-            elif self.game_state == 'paused':
-                self.run_pause_menu()
-            elif self.game_state == 'settings':
-                self.run_settings_menu()
-            elif self.game_state == 'level_transition':
-                self.run_level_transition(dt)
-            elif self.game_state == 'game_over':
-                self.run_game_over()
-
-            pygame.display.update()
-
+                    if event.key == pygame.K_F3:
+                        self.profiler.toggle()
+                    else:
+                        presses.add(event.key)
+
+            # replays start with the first frame that runs anything but the menu
+            self.run_frame(dt_ms, presses)
+            if self.recorder is not None and self.frame_state != 'menu':
+                swapped = self.frame_state == 'level_transition' and self.game_state != 'level_transition'
+                self.recorder.record(dt_ms, self.input_source.get_pressed(), presses, swapped, self.checksum)
+            elif self.recorder is not None:
+                self.recorder.header['ticks'] = self.sim_ticks
+
+            self.present()
+
+        self.profiler.dump()
         pygame.quit()
 
+    def overlay_counters(self):
+        drawn, culled = self.all_sprites.drawn_count, self.all_sprites.culled_count
+        return {'sprites drawn': f'{drawn}/{drawn + culled}', **self.hud.counters()}
+
+    def present(self):
+        # the profiler overlay goes on last, presenting is timed as its own phase
+        self.profiler.draw_overlay(self.display_surface, self.font, self.overlay_counters)
+        self.profiler.begin()
+        self.screen.present()
+        self.profiler.lap('display_update')
+
+    def run_frame(self, dt_ms, presses, render = True):
+        """One frame of the state machine: the frame time in ms and the keys pressed during it are its only inputs"""
+        self.sim_ticks += dt_ms
+        dt = dt_ms / 1000
+        for key in presses:
+            if key == pygame.K_p:
+                if self.game_state == 'playing':
+                    self.game_state = 'paused'
+                elif self.game_state == 'paused':
+                    self.game_state = 'playing'
+            elif key == pygame.K_RETURN:
+                if self.game_state == 'menu':
+                    self.game_state = 'playing'
+            elif key == pygame.K_COMMA and self.game_state == 'playing':
+                self.current_level += 1
+                self.start_level_transition()
+            elif key == pygame.K_1 and self.game_state == 'playing':
+                self.current_level = 1
+                self.start_level_transition()
+            elif key == pygame.K_2 and self.game_state == 'playing':
+                self.current_level = 2
+                self.start_level_transition()
+            elif key == pygame.K_3 and self.game_state == 'playing':
+                self.current_level = 3
+                self.start_level_transition()
+            elif key == pygame.K_4 and self.game_state == 'playing':
+                self.current_level = 4
+                self.start_level_transition()
+            elif key == pygame.K_5 and self.game_state == 'playing':
+                self.current_level = 5
+                self.start_level_transition()
+        
+        keys = self.input_source.get_pressed()
+        if keys[pygame.K_c] and keys[pygame.K_LCTRL]:
+            self.running = False
+
+        # one clock read per frame fires every due timer
+        self.profiler.begin()
+        self.scheduler.paused = self.game_state != 'playing'
+        self.scheduler.tick()
+        self.profiler.lap('timers')
+
+        # the profiler overlay is redrawn every frame, so the screen under it must be too
+        if self.profiler.show_overlay:
+            self.screen.invalidate()
+
+        # State machine
+        self.frame_state = self.game_state
+        if self.game_state == 'menu':
+            self.run_menu()
+        elif self.game_state == 'playing':
+            self.screen.begin('playing', static = False)
+            self.run_fixed_steps(dt * self.scheduler.time_scale, render)
+        elif self.game_state == 'paused':
+            if render:
+                self.run_pause_menu()
+        elif self.game_state == 'settings':
+            self.run_settings_menu()
+        elif self.game_state == 'level_transition':
+            self.run_level_transition(dt, render)
+        elif self.game_state == 'game_over':
+            self.run_game_over(render)
+
+    def checksum(self):
+        """CRC of the state a replay must reproduce exactly"""
+        player = getattr(self, 'player', None)
+        state = (self.current_level, self.game_state, len(self.enemy_sprites), self.rng.getstate()[1][-1])
+        if player is not None:
+            state += (player.rect.x, player.rect.y, player.health, player.points, player.coins)
+        return zlib.crc32(repr(state).encode())
+
+    def record(self):
+        """Record this session, the recording starts once play leaves the menu"""
+        self.recorder = Recorder(self.seed, self.current_level, self.sim_ticks)
+
+    def play(self, replay, render = True, speed = 1):
+        """Play a recording back frame for frame and check it against its checksums; speed 0 runs as fast as possible"""
+        self.playback = self.input_source = replay
+        self.rng.seed(replay.seed)
+        self.current_level = replay.level
+        self.game_state = 'playing'
+        self.sim_ticks = replay.ticks
+        self.scheduler.reset()
+        while self.running and not replay.done:
+            replay.advance()
+            self.run_frame(replay.dt_ms, replay.presses, render)
+            replay.verify(self.checksum)
+            if render:
+                # the replay supplies the game's input, the window only takes F3 and closing
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT:
+                        self.running = False
+                    elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                        self.profiler.toggle()
+                self.present()
+            if speed:
+                self.clock.tick(FRAMERATE * speed)
+        return replay.frame
+
     def reset_game(self):
         """Reset the game state to start a new game"""
         self.current_level = 1
@@ -472,9 +547,6 @@ class Game:
         self.level_start_points = 0
 
     def run_menu(self):
-        self.display_surface.fill(BG_COLOR)
-        self.display_surface.blit(self.background, (0, 0))
-
         screen_width = self.display_surface.get_width()
         screen_height = self.display_surface.get_height()
 
@@ -499,47 +571,45 @@ class Game:
         mouse_pos = pygame.mouse.get_pos()
         mouse_clicked = pygame.mouse.get_pressed()[0]  # Left click
 
-        if start_button.collidepoint(mouse_pos):
-            pygame.draw.rect(self.display_surface, (100, 100, 100), start_button)  # Lighter when hovered
-            if mouse_clicked:
-                self.game_state = 'playing'
-                self.level_loaded = False
-        else:
-            pygame.draw.rect(self.display_surface, (70, 70, 70), start_button)  # Darker when not hovered
-
-        if quit_button.collidepoint(mouse_pos):
-            pygame.draw.rect(self.display_surface, (100, 100, 100), quit_button)
-            if mouse_clicked:
-                self.running = False
-        else:
-            pygame.draw.rect(self.display_surface, (70, 70, 70), quit_button)
-
-        start_text = self.font.render("Start Game", True, (255, 255, 255))  # White text
-        start_text_rect = start_text.get_rect(center=start_button.center)
-        self.display_surface.blit(start_text, start_text_rect)
-        
-        quit_text = self.font.render("Quit", True, (255, 255, 255))  # White text
-        quit_text_rect = quit_text.get_rect(center=quit_button.center)
-        self.display_surface.blit(quit_text, quit_text_rect)
+        redraw = self.screen.begin('menu')
+        if redraw:
+            self.display_surface.fill(BG_COLOR)
+            self.display_surface.blit(self.background, (0, 0))
+
+        # a button is only repainted when the screen is new or its hover state flips
+        for button, label in ((start_button, "Start Game"), (quit_button, "Quit")):
+            hovered = button.collidepoint(mouse_pos)
+            if redraw or hovered != self.menu_hover.get(label):
+                pygame.draw.rect(self.display_surface, (100, 100, 100) if hovered else (70, 70, 70), button)  # Lighter when hovered
+                text = self.screen.text(self.font, label, (255, 255, 255))  # White text
+                self.display_surface.blit(text, text.get_rect(center=button.center))
+                self.screen.mark(button)
+                self.menu_hover[label] = hovered
+
+        if mouse_clicked and start_button.collidepoint(mouse_pos):
+            self.game_state = 'playing'
+            self.level_loaded = False
+        elif mouse_clicked and quit_button.collidepoint(mouse_pos):
+            self.running = False
 
     def run_pause_menu(self):
+        # drawn once over the frozen game frame, nothing changes until P is pressed again
+        if not self.screen.begin('paused'):
+            return
+        self.display_surface.blit(self.screen.backdrop(), (0, 0))
+
         center_x = self.display_surface.get_width() // 2
         center_y = self.display_surface.get_height() // 2 - 60  # Your text offset
 
-        overlay = pygame.Surface((300, 60))
-        overlay.fill(BG_WHITE)
-        overlay.set_alpha(64)
-
-        overlay2 = pygame.Surface ((302, 62))
-        overlay2.fill('#000000')
-        overlay2.set_alpha(64)
+        overlay = self.screen.overlay((300, 60), BG_WHITE, 64)
+        overlay2 = self.screen.overlay((302, 62), '#000000', 64)
 
         overlay_x = center_x - 150
         overlay_y = center_y - 30
         self.display_surface.blit(overlay2, (overlay_x -1 , overlay_y-1))
         self.display_surface.blit(overlay, (overlay_x, overlay_y))
 
-        resume_text = self.font.render("Press P to Resume", True, (0, 0, 0))
+        resume_text = self.screen.text(self.font, "Press P to Resume", (0, 0, 0))
         text_rect = resume_text.get_rect(center=(center_x, center_y))
         self.display_surface.blit(resume_text, text_rect)
     
@@ -551,43 +621,54 @@ class Game:
         pass
 
     def load_level(self, level_num):
-        if hasattr(self, 'player'):
-            self.level_start_points += self.player.points
-            self.level_start_coins += self.player.coins
-        if hasattr(self, 'top_portal') and self.top_portal is not None:
-            self.top_portal.kill()
-        if hasattr(self, 'bottom_portal') and self.bottom_portal is not None:
-            self.bottom_portal.kill()
-        self.all_sprites.empty()
-        self.collision_sprites.empty()
-        self.collectible_sprites.empty()
-        self.bullet_sprites.empty()
-        self.enemy_sprites.empty()
-
-        self.setup(level_num)
+        self.swap_level(self.build_level(level_num))
+
+    def run_fixed_steps(self, frame_time, render = True):
+        """Run as many fixed physics steps as the frame time covers, then draw interpolated"""
+        self.accumulator += frame_time
+        steps = 0
+        draw = True
+        while self.accumulator >= PHYSICS_DT and self.game_state == 'playing':
+            if steps == MAX_PHYSICS_STEPS:
+                # after a stall, drop the backlog instead of spiralling, keep the fraction for interpolation
+                dropped = int(self.accumulator // PHYSICS_DT)
+                self.dropped_steps += dropped
+                self.accumulator -= dropped * PHYSICS_DT
+                break
+            draw = self.update_game(PHYSICS_DT, self.current_level)
+            self.accumulator -= PHYSICS_DT
+            steps += 1
 
-        self.bee_timer = Timer(1000, func = self.create_bee, autostart = True, repeat = True)
-        self.dialogue_timer = Timer(3000)
+        if render and draw and self.level_loaded and self.game_state in ('playing', 'game_over'):
+            self.draw_game(self.accumulator / PHYSICS_DT)
+
+    def run_game(self, dt, level_num, render = True):
+        # one update of dt, drawn without interpolation
+        if self.update_game(dt, level_num) and render:
+            self.draw_game()
 
-    def run_game(self, dt, level_num):
+    def update_game(self, dt, level_num):
+        """Advance the level by dt, returns False when the frame shouldn't be drawn"""
         if level_num > self.total_levels:
             self.game_state = 'game_over'
-            return
+            return False
         if not self.level_loaded:
             self.load_level(level_num)
             self.level_loaded = True
 
-        self.bee_timer.update()
-        self.dialogue_timer.update()
-        self.shop_interaction_cooldown.update()
+        profiler = self.profiler
+        profiler.begin()
         self.all_sprites.update(dt)
+        profiler.lap('update')
         self.collision()
+        profiler.lap('collision')
         self.handle_shop_input()
+        profiler.lap('shop_input')
 
         if self.check_level_complete():
             self.current_level += 1
             self.start_level_transition()
-            return
+            return False
         
         if hasattr(self, 'player') and self.player.health <= 0:
             self.death_total += 1
@@ -595,13 +676,24 @@ class Game:
             self.player.coins = 0
             self.player.health_pots = 0
         
-        
-        self.display_surface.fill(BG_COLOR)
-        # self.display_surface.blit(self.background, (0, 0))
-        if self.player:
-            self.all_sprites.draw(self.player.rect.center)
+        profiler.begin()
         self.popup_system.update()
+        profiler.lap('popups_update')
+        return True
+
+    def draw_game(self, alpha = 1):
+        profiler = self.profiler
+        profiler.begin()
+        target = self.all_sprites.interpolated_center(self.player, alpha) if self.player else None
+        if target:
+            self.all_sprites.aim(target)
+        self.parallax.draw(self.display_surface, self.all_sprites.offset)
+        profiler.lap('background')
+        if target:
+            self.all_sprites.draw(target, alpha)
+        profiler.lap('draw')
         self.popup_system.draw()
+        profiler.lap('popups_draw')
         if self.show_shop:
             shop_pos = (WINDOW_WIDTH // 2 - 400, WINDOW_HEIGHT // 2 - 400)
             self.display_surface.blit(self.ui_assets['shop_ui'], shop_pos)
@@ -621,23 +713,46 @@ class Game:
                     self.display_surface.blit(name_text, (icon_pos[0] + 180, icon_pos[1]))
                     self.display_surface.blit(price_text, (icon_pos[0] + 180, icon_pos[1] + 20))
         self.display_score_area()
+        profiler.lap('hud') # shop panel included
 
         '''# collision red square debug
-        for sprite in self.collision_sprites:
-            offset_rect = sprite.rect.copy()
-            platform_rect_debug = sprite.rect.copy()
+        for tile_rect in self.collision_grid.rects_near(self.player.rect):
+            offset_rect = tile_rect.copy()
+            platform_rect_debug = tile_rect.copy()
             offset_rect.topleft += self.all_sprites.offset
             platform_rect_debug.height = 16
             platform_rect_debug.topleft += self.all_sprites.offset
             pygame.draw.rect(self.display_surface, (0,0,0), platform_rect_debug, 1)
             pygame.draw.rect(self.display_surface, (255,0,0), offset_rect, 1)'''
 
-    def run_game_over(self):
+    def run_game_over(self, render = True):
         """Handle the game over screen"""
+        # drawn once over the last game frame, only ENTER is polled afterwards
+        if render and self.screen.begin('game_over'):
+            self.draw_game_over()
+
+        # Add key handler in the event loop section
+        keys = self.input_source.get_pressed()
+        if keys[pygame.K_RETURN]:
+            if self.current_level >= self.total_levels:
+                # Complete reset if at final level
+                self.reset_game()
+                self.player.points = 0
+                self.player.health_pots = 0
+                self.death_total = 0
+            else:
+                # Just reload current level if not at final level
+                self.retry_level()
+
+    def retry_level(self):
+        self.game_state = 'playing'
+        self.level_loaded = False
+        self.player.points = self.level_start_points
+
+    def draw_game_over(self):
         # Create semi-transparent overlay
-        overlay = pygame.Surface(self.display_surface.get_size())
-        overlay.fill((0, 0, 0))
-        overlay.set_alpha(128)
+        self.display_surface.blit(self.screen.backdrop(), (0, 0))
+        overlay = self.screen.overlay(self.display_surface.get_size(), (0, 0, 0), 128)
         self.display_surface.blit(overlay, (0, 0))
         
         # Calculate vertical positioning
@@ -674,21 +789,6 @@ class Game:
         restart_rect = restart_text.get_rect(center=(self.display_surface.get_width() // 2, start_y + line_spacing * 4))
         self.display_surface.blit(restart_text, restart_rect)
 
-        # Add key handler in the event loop section
-        keys = pygame.key.get_pressed()
-        if keys[pygame.K_RETURN]:
-            if self.current_level >= self.total_levels:
-                # Complete reset if at final level
-                self.reset_game()
-                self.player.points = 0
-                self.player.health_pots = 0
-                self.death_total = 0
-            else:
-                # Just reload current level if not at final level
-                self.game_state = 'playing'
-                self.level_loaded = False
-                self.player.points = self.level_start_points
-
     def check_level_complete(self):
         if hasattr(self, 'player'):
             if (hasattr(self.player, 'cherries') and 
@@ -702,18 +802,21 @@ class Game:
     def start_level_transition(self):
         """Start the level transition sequence"""
         self.game_state = 'level_transition'
-        self.transition_timer = pygame.time.get_ticks()
+        self.transition_timer = get_ticks()
         self.fade_alpha = 0
         self.fade_direction = 1
 
-    def run_level_transition(self, dt):
+        # build the next level while the fade runs
+        self.preloaded_level = None
+        if self.current_level <= self.total_levels:
+            self.level_loader.start(self.current_level)
+
+    def run_level_transition(self, dt, render = True):
         """Handle the level transition screen"""
-        current_time = pygame.time.get_ticks()
+        current_time = get_ticks()
         elapsed = current_time - self.transition_timer
-        
-        # Create overlay surface for fade effect
-        overlay = pygame.Surface(self.display_surface.get_size())
-        overlay.fill((0, 0, 0))
+        if self.preloaded_level is None and self.level_loader.busy:
+            self.preloaded_level = self.level_loader.poll()
         
         # Calculate fade alpha
         if self.fade_direction == 1:  # Fading in
@@ -722,33 +825,150 @@ class Game:
                 self.fade_direction = -1
         else:  # Fading out
             self.fade_alpha = max(0, 255 - ((elapsed - (self.transition_duration / 2)) / (self.transition_duration / 2)) * 255)
+
+        if render:
+            self.draw_level_transition(elapsed)
         
-        # Apply fade
-        overlay.set_alpha(self.fade_alpha)
+        # Check if transition is complete
+        if self.transition_ready(elapsed):
+            self.game_state = 'playing'
+            if self.preloaded_level is not None:
+                self.swap_level(self.preloaded_level)
+                self.preloaded_level = None
+            else:
+                self.level_loaded = False
+
+    def transition_ready(self, elapsed):
+        if self.playback is not None:
+            # a replay swaps on the recorded frame, however long the loader takes this time
+            ready = self.playback.swapped
+        elif self.headless:
+            # simulated time outruns the loader thread, wait for it so runs repeat exactly
+            ready = elapsed >= self.transition_duration
+        else:
+            return elapsed >= self.transition_duration and not self.level_loader.busy
+        if ready and self.level_loader.busy:
+            self.preloaded_level = self.level_loader.wait()
+        return ready
+
+    def draw_level_transition(self, elapsed):
+        center_x = self.display_surface.get_width() // 2
+        center_y = self.display_surface.get_height() // 2
+
+        # Show real progress once the fade is done but the level is still building
+        loading_text = None
+        if elapsed >= self.transition_duration and self.level_loader.busy:
+            loading_text = self.screen.text(self.font, f"Loading... {int(self.level_loader.progress * 100)}%", (255, 255, 255))
+        loading_rect = loading_text.get_rect(center=(center_x, center_y + 100)) if loading_text else None
+
+        # Create overlay surface for fade effect
+        overlay = self.screen.overlay(self.display_surface.get_size(), (0, 0, 0), self.fade_alpha)
+
+        # the fade repaints everything, once it settles only the loading line changes
+        if not self.screen.begin(('level_transition', self.current_level, int(self.fade_alpha))):
+            if loading_text is not self.loading_text:
+                dirty = loading_rect.union(self.loading_rect) if loading_rect and self.loading_rect else loading_rect or self.loading_rect
+                self.display_surface.fill(BG_COLOR, dirty)
+                if loading_text:
+                    self.display_surface.blit(loading_text, loading_rect)
+                self.display_surface.blit(overlay, dirty, dirty)
+                self.screen.mark(dirty)
+                self.loading_text, self.loading_rect = loading_text, loading_rect
+            return
         
         # Draw background
         self.display_surface.fill(BG_COLOR)
         
         # Draw level text
-        level_text = self.large_font.render(f"Level {self.current_level}", True, (255, 255, 255))
-        level_rect = level_text.get_rect(center=(self.display_surface.get_width() // 2,
-                                               self.display_surface.get_height() // 2))
+        level_text = self.screen.text(self.large_font, f"Level {self.current_level}", (255, 255, 255))
+        level_rect = level_text.get_rect(center=(center_x, center_y))
         
         # Draw score if available
         if hasattr(self, 'player'):
-            score_text = self.font.render(f"Score: {self.player.points}", True, (255, 255, 255))
-            score_rect = score_text.get_rect(center=(self.display_surface.get_width() // 2,
-                                                   self.display_surface.get_height() // 2 + 50))
+            score_text = self.screen.text(self.font, f"Score: {self.player.points}", (255, 255, 255))
+            score_rect = score_text.get_rect(center=(center_x, center_y + 50))
             self.display_surface.blit(score_text, score_rect)
+
+        if loading_text:
+            self.display_surface.blit(loading_text, loading_rect)
+        self.loading_text, self.loading_rect = loading_text, loading_rect
         
         self.display_surface.blit(level_text, level_rect)
         self.display_surface.blit(overlay, (0, 0))
-        
-        # Check if transition is complete
-        if elapsed >= self.transition_duration:
-            self.game_state = 'playing'
-            self.level_loaded = False
+
+    def step(self, dt = PHYSICS_DT, render = False):
+        """Advance one frame with a fixed dt, for headless runs: no events, no frame cap"""
+        self.sim_ticks += dt * 1000
+        self.input_source.advance()
+        # the game clock stops outside 'playing' here too, or a transition's steps would all land on the next tick
+        self.scheduler.paused = self.game_state != 'playing'
+        self.scheduler.tick()
+        if self.game_state == 'playing':
+            self.run_game(dt, self.current_level, render)
+        elif self.game_state == 'level_transition':
+            self.run_level_transition(dt, render)
+
+    def simulate(self, frames, dt = PHYSICS_DT, render = False):
+        """Step up to frames frames, stops early on game over; returns the frames stepped"""
+        for frame in range(frames):
+            if self.game_state == 'game_over' or not self.running:
+                return frame
+            self.step(dt, render)
+        return frames
 
 if __name__ == '__main__':
-    game = Game()
-    game.run() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description = 'Platformer')
+    parser.add_argument('--headless', action = 'store_true', help = 'simulate without a window, as fast as possible')
+    parser.add_argument('--level', type = int, default = 1)
+    parser.add_argument('--frames', type = int, default = 60 * PHYSICS_RATE, help = 'physics steps to simulate in headless mode')
+    parser.add_argument('--seed', type = int, default = None, help = 'seed for the game and the random headless input')
+    parser.add_argument('--render', action = 'store_true', help = 'still draw every frame in headless mode')
+    parser.add_argument('--profile', action = 'store_true', help = 'record per-phase timings and dump them on exit')
+    parser.add_argument('--record', metavar = 'PATH', help = 'record the session to a replay file')
+    parser.add_argument('--replay', metavar = 'PATH', help = 'play a replay file back and check it for divergence')
+    parser.add_argument('--speed', type = float, default = 1, help = 'replay speed in a window, 0 for as fast as possible')
+    args = parser.parse_args()
+
+    if args.replay:
+        replay = ReplayInput(args.replay)
+        game = Game(headless = args.headless, input_source = replay, seed = replay.seed)
+        if args.profile:
+            game.profiler.enable(keep = True)
+        start = time.perf_counter()
+        frames = game.play(replay, render = args.render or not args.headless, speed = 0 if args.headless else args.speed)
+        elapsed = time.perf_counter() - start
+        game.profiler.dump()
+        result = 'in sync' if replay.divergence is None else f'diverged at frame {replay.divergence}'
+        print(f'replayed {frames} of {len(replay)} frames in {elapsed:.2f}s, {result}, state: {game.game_state}')
+    elif args.headless:
+        game = Game(headless = True, input_source = RandomInput(args.seed), seed = args.seed)
+        game.current_level = args.level
+        if args.profile:
+            game.profiler.enable()
+        start = time.perf_counter()
+        frames = game.simulate(args.frames, render = args.render)
+        elapsed = time.perf_counter() - start
+        game.profiler.dump()
+        for name, pool in game.pools.items():
+            print(f'{name} pool: {pool.report()}')
+        print(f'assets: {game.assets.report()}')
+        print(f'lifecycle: {game.lifecycle.report()}')
+        if args.render:
+            print(f'hud: {game.hud.stats()}')
+            print(f'culling: {game.all_sprites.drawn_count} sprites drawn, {game.all_sprites.culled_count} culled in the last frame')
+        print(f'simulated {frames} frames of level {args.level} in {elapsed:.2f}s '
+              f'({frames * PHYSICS_DT / max(elapsed, 1e-9):.0f}x real time), state: {game.game_state}')
+    else:
+        game = Game(seed = args.seed)
+        if args.profile:
+            game.profiler.enable(keep = True)
+            game.profiler.toggle()
+        if args.record:
+            game.record()
+        game.run()
+        if args.profile:
+            print(f'parallax: {game.parallax.report()}')
+            print(f'hud: {game.hud.stats()}')
+        if args.record:
+            size = game.recorder.save(args.record)
+            print(f'recorded {len(game.recorder)} frames to {args.record}, {size} bytes') 
\ No newline at end of file
@@ -0,0 +1,202 @@
+from settings import *
+from bisect import bisect_left
+from collections import OrderedDict
+from heapq import heappush, heappop
+from math import hypot
+
+WALK, FALL, JUMP, PORTAL = 1, 2, 3, 4
+
+BODY = (TILE_SIZE - 16, TILE_SIZE) # the player's collision box, what has to fit through a jump
+JUMP_RANGE = 6 # tiles across a jump link may span at most, the arc decides what's really reachable
+JUMP_DROP = 4 # tiles a jump may land below its start, further down falls take over
+JUMP_COST = 0.5 # on top of the distance, prefer walking when it's about as short
+PORTAL_COST = 1
+UNREACHABLE = -1
+
+def jump_lands(solid, width, height, start, target, physics, step = PHYSICS_DT):
+    # fly the player's jump from standing on start towards target: full run speed until above it, then
+    # straight down; it lands when the feet come down onto the target's ground without hitting a tile
+    speed, gravity, jump_speed = physics
+    body_width, body_height = BODY
+    x, feet = (start[0] + 0.5) * TILE_SIZE, (start[1] + 1) * TILE_SIZE
+    goal_x, goal_feet = (target[0] + 0.5) * TILE_SIZE, (target[1] + 1) * TILE_SIZE
+    vy = -jump_speed
+    while True:
+        x += max(-speed * step, min(speed * step, goal_x - x))
+        vy += gravity * step
+        feet += vy * step
+        if vy > 0 and feet >= goal_feet:
+            return abs(x - goal_x) < 1
+        left, right = int((x - body_width / 2) // TILE_SIZE), int((x + body_width / 2 - 1) // TILE_SIZE)
+        top, bottom = int((feet - body_height) // TILE_SIZE), int((feet - 1) // TILE_SIZE)
+        for row in range(max(top, 0), min(bottom, height - 1) + 1):
+            for col in range(max(left, 0), min(right, width - 1) + 1):
+                if solid[row * width + col]:
+                    return False
+
+def build_navigation(solid, width, height, portals = (), physics = (PLAYER_SPEED, GRAVITY, JUMP_SPEED)):
+    """Walkable cells of a row-major solid grid and the links between them, as plain data for the level cache"""
+    # a walkable cell is empty with a solid cell below it, runs of them in a row are one surface
+    standing = lambda x, y: 0 <= x < width and 0 <= y < height - 1 and not solid[y * width + x] and solid[(y + 1) * width + x]
+    nodes = [(x, y) for y in range(height) for x in range(width) if standing(x, y)]
+    index = {cell: node for node, cell in enumerate(nodes)}
+    surface = {}
+    for x, y in nodes:
+        surface[x, y] = surface.get((x - 1, y), (x, y))
+
+    def landing(x, y):
+        # first walkable cell at or below (x, y), what anything falling down that column ends up on
+        while 0 <= x < width and 0 <= y < height:
+            if solid[y * width + x]:
+                return None
+            if (x, y) in index:
+                return index[x, y]
+            y += 1
+        return None
+
+    links = []
+    for node, (x, y) in enumerate(nodes):
+        for side in (-1, 1):
+            if (x + side, y) in index:
+                links.append((node, index[x + side, y], 1.0, WALK))
+            elif 0 <= x + side < width and not solid[y * width + x + side]:
+                below = landing(x + side, y)
+                if below is not None:
+                    links.append((node, below, hypot(1, nodes[below][1] - y), FALL))
+
+        for dy in range(-JUMP_DROP, int(physics[2] ** 2 / (2 * physics[1]) // TILE_SIZE) + 1):
+            for dx in range(-JUMP_RANGE, JUMP_RANGE + 1):
+                target = (x + dx, y - dy)
+                if target not in index or surface[target] == surface[x, y]:
+                    continue
+                if jump_lands(solid, width, height, (x, y), target, physics):
+                    links.append((node, index[target], hypot(dx, dy) + JUMP_COST, JUMP))
+
+    for top, bottom in portals:
+        # touching either portal puts the player at the other one, where it drops to the ground
+        ends = landing(*top), landing(*bottom)
+        if None not in ends:
+            links.append((ends[0], ends[1], PORTAL_COST, PORTAL))
+            links.append((ends[1], ends[0], PORTAL_COST, PORTAL))
+
+    return {'nodes': nodes, 'links': links, 'portals': list(portals), 'physics': physics}
+
+class NavGraph:
+    # A* over a level's navigation data; routes found towards a goal are kept per goal, so enemies
+    # chasing the same target share them, and any node on a found path already knows its way
+    def __init__(self, navigation, tile_size = TILE_SIZE, cache_goals = NAV_CACHE_GOALS):
+        self.tile_size = tile_size
+        self.nodes = navigation['nodes']
+        self.links = [[] for _ in self.nodes]
+        for a, b, cost, kind in navigation['links']:
+            self.links[a].append((b, cost, kind))
+        self.portals = [a for a, b, cost, kind in navigation['links'] if kind == PORTAL]
+
+        # column x: sorted rows of its walkable cells and their nodes, for position lookups
+        self.columns = {}
+        for node, (x, y) in enumerate(self.nodes):
+            rows, nodes = self.columns.setdefault(x, ([], []))
+            rows.append(y)
+            nodes.append(node)
+
+        self.routes = OrderedDict() # goal: {node: next node on a shortest path to goal}
+        self.cache_goals = cache_goals
+        self.stats = {'queries': 0, 'hits': 0, 'searches': 0, 'expanded': 0, 'unreachable': 0}
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def node_at(self, pos):
+        """The walkable cell under a pixel position, what a body standing or falling there ends up on"""
+        x, y = int(pos[0] // self.tile_size), int(pos[1] // self.tile_size)
+        if x not in self.columns:
+            return None
+        rows, nodes = self.columns[x]
+        i = bisect_left(rows, y)
+        return nodes[i] if i < len(rows) else None
+
+    def point(self, node):
+        # where a body stands on the node: the middle of its cell's floor
+        x, y = self.nodes[node]
+        return ((x + 0.5) * self.tile_size, (y + 1) * self.tile_size)
+
+    def kind(self, a, b):
+        """How to get from node a to its neighbour b: WALK, FALL, JUMP or PORTAL"""
+        return min((cost, kind) for node, cost, kind in self.links[a] if node == b)[1]
+
+    def path(self, start, goal):
+        """Nodes of a shortest path between two pixel positions, None if there's none"""
+        start, goal = self.node_at(start), self.node_at(goal)
+        if start is None or goal is None:
+            return None
+        return self.route(start, goal)
+
+    def route(self, start, goal):
+        self.stats['queries'] += 1
+        routes = self.routes.get(goal)
+        if routes is None:
+            routes = self.routes[goal] = {goal: None}
+            if len(self.routes) > self.cache_goals:
+                self.routes.popitem(last = False)
+        else:
+            self.routes.move_to_end(goal)
+
+        if start in routes:
+            self.stats['hits'] += 1
+        else:
+            self.search(start, goal, routes)
+        if routes[start] == UNREACHABLE:
+            return None
+
+        path = [start]
+        while routes[path[-1]] is not None:
+            path.append(routes[path[-1]])
+        return path
+
+    def search(self, start, goal, routes):
+        # A*, the heuristic is the straight line to the goal or to the nearest portal, whichever is shorter
+        self.stats['searches'] += 1
+        nodes, links = self.nodes, self.links
+        gx, gy = nodes[goal]
+        portals = [nodes[node] for node in self.portals]
+        def estimate(node):
+            x, y = nodes[node]
+            return min([hypot(gx - x, gy - y)] + [hypot(px - x, py - y) + PORTAL_COST for px, py in portals])
+
+        came_from = {start: None}
+        cost = {start: 0}
+        todo = [(estimate(start), 0, start)]
+        closed = set()
+        while todo:
+            _, spent, node = heappop(todo)
+            if node in closed:
+                continue
+            if node == goal:
+                break
+            closed.add(node)
+            self.stats['expanded'] += 1
+            for neighbour, step, kind in links[node]:
+                total = spent + step
+                if total < cost.get(neighbour, float('inf')):
+                    cost[neighbour] = total
+                    came_from[neighbour] = node
+                    heappush(todo, (total + estimate(neighbour), total, neighbour))
+        else:
+            # nothing reachable from start gets to the goal
+            for node in closed:
+                routes[node] = UNREACHABLE
+            self.stats['unreachable'] += 1
+            return
+
+        # every node on the path now knows its next step, later queries from any of them are lookups
+        while came_from[goal] is not None:
+            routes.setdefault(came_from[goal], goal)
+            goal = came_from[goal]
+
+    def report(self):
+        kinds = {WALK: 'walk', FALL: 'fall', JUMP: 'jump', PORTAL: 'portal'}
+        links = {}
+        for edges in self.links:
+            for _, _, kind in edges:
+                links[kinds[kind]] = links.get(kinds[kind], 0) + 1
+        return {'nodes': len(self), 'links': links, 'goals': len(self.routes), **self.stats}
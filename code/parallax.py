@@ -0,0 +1,173 @@
+from settings import *
+from collections import deque
+from math import ceil, floor
+from statistics import median
+from time import perf_counter
+
+# scenery behind each level, far to near: (image in data/graphics, horizontal and vertical scroll factor, optional).
+# Only optional layers may be hidden when the background runs over budget; with all of them hidden the
+# flat BG_COLOR fill is left, so a single painted layer is optional and falls back to that
+LAYERS = {
+    1: (('bg4.png', 0.2, 0.1, True),),
+    2: (('bg2.jpg', 0.2, 0.1, True),),
+    3: (('bg3.png', 0.2, 0.1, True),),
+    4: (('bg5.png', 0.2, 0.1, True),),
+    5: (('bg.png', 0.2, 0.1, True),),
+    6: (('bg3.png', 0.2, 0.1, True),),
+}
+FILL_SAMPLE = 8 # draws between timings of the flat fill the budget is scaled by
+CHANGES = 16 # sheds and restores kept for the report
+
+def layer_height(factor_y, world_height, view_height = WINDOW_HEIGHT):
+    # tall enough to cover the view wherever the camera is, so layers only wrap sideways
+    return view_height + ceil(max(world_height - view_height, 0) * factor_y)
+
+def is_opaque(image):
+    # every pixel fully opaque and no colorkey in use, whatever the file format claims
+    mask = pygame.mask.from_surface(image, 254)
+    return mask.count() == image.get_width() * image.get_height()
+
+def load_layer(file_name, height, backdrop = None):
+    """Load a scenery image scaled to height and mirrored side by side so it wraps without a seam, as (strip, opaque)"""
+    image = pygame.image.load(join('data', 'graphics', file_name))
+    if backdrop is not None and not is_opaque(image):
+        # the farthest layer only ever has the backdrop color behind it, bake that in once
+        flat = pygame.Surface(image.get_size())
+        flat.fill(backdrop)
+        flat.blit(image, (0, 0))
+        image = flat
+    opaque = is_opaque(image)
+    if opaque:
+        # no per-pixel alpha and no colorkey: blits are straight copies
+        image.set_colorkey(None)
+        image = image.convert()
+    else:
+        image = image.convert_alpha()
+    width = round(image.get_width() * height / image.get_height())
+    resize = pygame.transform.smoothscale if height < image.get_height() else pygame.transform.scale
+    image = resize(image, (width, height))
+
+    strip = pygame.Surface((width * 2, height), 0 if opaque else pygame.SRCALPHA)
+    strip.blit(image, (0, 0))
+    strip.blit(pygame.transform.flip(image, True, False), (width, 0))
+    return (strip.convert() if opaque else strip.convert_alpha()), opaque
+
+class Parallax:
+    # scenery layers scrolled at a fraction of the camera offset. An opaque layer covers the whole view,
+    # so drawing starts at the nearest one and only see-through layers in front of it are blended.
+    # The budget is a multiple of the flat fill the background replaces, timed on the same surface, so it
+    # holds on slower machines. Over budget only optional layers are hidden, down to the flat fill,
+    # and they come back once the rest runs at half the budget
+    def __init__(self, layers = (), budget = BACKGROUND_BUDGET, samples = BACKGROUND_SAMPLES, warmup = BACKGROUND_WARMUP):
+        self.layers = list(layers) # (strip, opaque, factor_x, factor_y, optional), far to near
+        self.hidden = [] # indices of shed layers, most recent last
+        self.budget = budget
+        self.warmup = warmup
+        self.skip = warmup # draws left out of the average, the first ones after a swap while caches warm
+        self.costs = deque(maxlen = samples) # ms per draw
+        self.fill_costs = deque(maxlen = samples // FILL_SAMPLE or 1) # ms per flat fill
+        self.stats = {'frames': 0, 'blits': 0, 'shed': 0, 'restored': 0, 'peak_ms': 0}
+        self.changes = deque(maxlen = CHANGES) # (frame, 'shed' or 'restore', layer index, mean ms, budget ms)
+
+    def __len__(self):
+        return len(self.layers) - len(self.hidden)
+
+    def visible(self):
+        return [layer for i, layer in enumerate(self.layers) if i not in self.hidden]
+
+    def draw(self, surface, offset):
+        if not self.layers:
+            surface.fill(BG_COLOR)
+            return
+        layers = self.visible()
+        first = max((i for i, layer in enumerate(layers) if layer[1]), default = None)
+        measure = self.skip <= 0
+        start = perf_counter()
+        if first is None or (measure and len(self.costs) % FILL_SAMPLE == 0):
+            # the reference the budget scales, sampled now and then when an opaque layer covers it again
+            surface.fill(BG_COLOR)
+            fill = (perf_counter() - start) * 1000
+            if measure:
+                self.fill_costs.append(fill)
+            if first is not None:
+                start = perf_counter()
+        for strip, opaque, factor_x, factor_y, _ in layers[first or 0:]:
+            self.blit(surface, strip, -offset.x * factor_x, -offset.y * factor_y)
+
+        cost = (perf_counter() - start) * 1000
+        self.stats['frames'] += 1
+        if not measure:
+            self.skip -= 1
+            return
+        self.costs.append(cost)
+        self.stats['peak_ms'] = max(self.stats['peak_ms'], cost)
+        if len(self.costs) == self.costs.maxlen:
+            mean, budget = sum(self.costs) / len(self.costs), self.budget_ms()
+            if mean > budget:
+                self.shed(first or 0, mean, budget)
+            elif self.hidden and mean < budget / 2:
+                self.restore(mean, budget)
+            self.costs.clear()
+
+    def blit(self, surface, strip, x, y):
+        # the visible window of the strip, in two pieces where it wraps around
+        width, height = surface.get_size()
+        strip_width = strip.get_width()
+        x = floor(x) % strip_width
+        y = min(max(floor(y), 0), strip.get_height() - height)
+        left = 0
+        while left < width:
+            span = min(strip_width - x, width - left)
+            surface.blit(strip, (left, 0), (x, y, span, height))
+            self.stats['blits'] += 1
+            left += span
+            x = 0
+
+    def budget_ms(self):
+        return self.budget * median(self.fill_costs) if self.fill_costs else float('inf')
+
+    def shed(self, first, mean, budget):
+        # over budget for a whole sample window: hide the nearest drawn optional layer, the flat fill stays
+        drawn = [i for i in range(len(self.layers)) if i not in self.hidden][first:]
+        optional = [i for i in drawn if self.layers[i][4]]
+        if not optional:
+            return
+        self.hidden.append(optional[-1])
+        self.skip = self.warmup
+        self.stats['shed'] += 1
+        self.changes.append((self.stats['frames'], 'shed', optional[-1], round(mean, 3), round(budget, 3)))
+
+    def restore(self, mean, budget):
+        # well under budget again: bring back the most recently hidden layer
+        index = self.hidden.pop()
+        self.skip = self.warmup
+        self.stats['restored'] += 1
+        self.changes.append((self.stats['frames'], 'restore', index, round(mean, 3), round(budget, 3)))
+
+    def report(self):
+        mean = sum(self.costs) / len(self.costs) if self.costs else 0
+        fill = median(self.fill_costs) if self.fill_costs else 0
+        return {'layers': len(self), 'hidden': len(self.hidden), 'opaque': sum(1 for layer in self.visible() if layer[1]),
+                'bytes': sum(layer[0].get_width() * layer[0].get_height() * layer[0].get_bytesize() for layer in self.layers),
+                'mean_ms': round(mean, 3), 'fill_ms': round(fill, 3), 'budget_ms': round(self.budget * fill, 3), **self.stats,
+                'changes': list(self.changes)}
+
+if __name__ == '__main__':
+    # check every level's scenery sheds to the flat fill over budget and comes back under it,
+    # run from the project root: python code/parallax.py
+    from assets import AssetManager
+    from atlas import load_atlas
+    from levels import load_level_data
+    pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+    assets, offset = AssetManager(load_atlas()), pygame.Vector2()
+    for level_num in sorted(LAYERS):
+        layers = assets.background_layers(level_num, load_level_data(level_num))
+        parallax = Parallax(layers, budget = 0, samples = 16, warmup = 2)
+        while len(parallax):
+            parallax.draw(pygame.display.get_surface(), offset)
+            assert parallax.stats['frames'] < 16 * (len(layers) + 2), f'level {level_num} never shed its scenery'
+        parallax.budget = float('inf')
+        while parallax.hidden:
+            parallax.draw(pygame.display.get_surface(), offset)
+            assert parallax.stats['frames'] < 16 * (2 * len(layers) + 4), f'level {level_num} never restored its scenery'
+        print(f'world{level_num}: {parallax.stats["shed"]} shed, {parallax.stats["restored"]} restored in {parallax.stats["frames"]} draws')
@@ -0,0 +1,37 @@
+from settings import *
+
+class SpritePool:
+    # keeps killed sprites of one class around and resets them instead of building new ones
+    def __init__(self, sprite_class, size):
+        self.sprite_class = sprite_class
+        self.size = size # most idle sprites kept, extras are left to the garbage collector
+        self.free = []
+        self.stats = {'hits': 0, 'misses': 0, 'allocated': 0, 'released': 0, 'dropped': 0}
+
+    def acquire(self, groups, **kwargs):
+        """Reuse an idle sprite, or build one, with the class's constructor arguments"""
+        if self.free:
+            sprite = self.free.pop()
+            sprite.reset(**kwargs)
+            sprite.add(groups)
+            self.stats['hits'] += 1
+        else:
+            sprite = self.sprite_class(groups = groups, **kwargs)
+            sprite.pool = self
+            self.stats['misses'] += 1
+            self.stats['allocated'] += 1
+        return sprite
+
+    def release(self, sprite):
+        # called from Sprite.kill once the sprite has left all its groups
+        if len(self.free) < self.size:
+            self.free.append(sprite)
+            self.stats['released'] += 1
+        else:
+            self.stats['dropped'] += 1
+
+    def report(self):
+        stats = dict(self.stats, idle = len(self.free), size = self.size)
+        requests = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / requests, 3) if requests else 0
+        return stats
@@ -1,18 +1,60 @@
 import pygame
+from collections import OrderedDict, deque
+from heapq import heappush, heappop
+from itertools import count
+from timer import get_ticks
 
 class PopupText:
-    def __init__(self, surface, font):
+    def __init__(self, surface, font, cache_size = 16):
         self.display_surface = surface
         self.popup_images = {}  # Dictionary to store different popup images
-        self.messages = []
+        self.messages = deque()  # oldest first
+        self.deadlines = []  # heap of (expire_time, id, message)
+        self.ids = count()
         self.font = font
 
+        # composed popup surfaces, least recently used first
+        self.cache_size = cache_size
+        self.surface_cache = OrderedDict()
+
+        self.message_spacing = 80  # Space between each scroll
+        self.line_spacing = 20    # Space between lines within a message
+
     def add_popup_image(self, name, image):
         # Method to register new popup images
         self.popup_images[name] = image
+        self.surface_cache.clear()
+
+    def compose(self, text, image_type):
+        key = (text, image_type)
+        if key in self.surface_cache:
+            self.surface_cache.move_to_end(key)
+            return self.surface_cache[key]
+
+        # background and text rendered together once, positioned around the image center
+        image = self.popup_images[image_type]
+        lines = text.split('\n')
+        image_rect = image.get_rect(center = (0, 0))
+        text_start_y = image_rect.centery - ((len(lines) - 1) * self.line_spacing) // 2
+        text_surfs = []
+        for j, line in enumerate(lines):
+            text_surface = self.font.render(line, True, (0, 0, 0))
+            text_surfs.append((text_surface, text_surface.get_rect(center = (0, text_start_y + j * self.line_spacing))))
+        bounds = image_rect.unionall([rect for _, rect in text_surfs])
+
+        surf = pygame.Surface(bounds.size, pygame.SRCALPHA)
+        surf.blit(image, image_rect.move(-bounds.x, -bounds.y))
+        for text_surface, rect in text_surfs:
+            surf.blit(text_surface, rect.move(-bounds.x, -bounds.y))
+        composed = (surf, (-bounds.x, -bounds.y), len(lines))
+
+        self.surface_cache[key] = composed
+        if len(self.surface_cache) > self.cache_size:
+            self.surface_cache.popitem(last = False)
+        return composed
 
     def add_message(self, text, image_type='status_scroll', duration=2000):
-        current_time = pygame.time.get_ticks()
+        current_time = get_ticks()
 
         # Check for duplicates
         for msg in self.messages:
@@ -21,56 +63,42 @@ class PopupText:
 
         # Limit to last 3 messages (or whatever number you prefer)
         if len(self.messages) >= 3:
-            self.messages.pop(0)  # Remove oldest message
+            self.messages.popleft()  # Remove oldest message, its deadline is skipped when it comes up
 
-        self.messages.append({
+        message = {
             'text': text,
             'image_type': image_type,
             'spawn_time': current_time,
-            'duration': duration
-        })
-    
+            'duration': duration,
+            'composed': self.compose(text, image_type) if image_type in self.popup_images else None
+        }
+        self.messages.append(message)
+        heappush(self.deadlines, (current_time + duration, next(self.ids), message))
+
     def update(self):
         if not self.popup_images:
             return
-        current_time = pygame.time.get_ticks()
+        current_time = get_ticks()
+
+        while self.deadlines and self.deadlines[0][0] <= current_time:
+            message = heappop(self.deadlines)[2]
+            for i, msg in enumerate(self.messages):
+                if msg is message:
+                    del self.messages[i]
+                    break
 
-        self.messages = [msg for msg in self.messages 
-                        if current_time - msg['spawn_time'] < msg['duration']]
-    
     def draw(self):
-        
+
         if not self.popup_images or not self.messages:
             return
 
-        screen_width = self.display_surface.get_width()
-        screen_height = self.display_surface.get_height()
-
-        base_y = screen_height - 100
-        message_spacing = 80  # Space between each scroll
-        line_spacing = 20    # Space between lines within a message
+        center_x = self.display_surface.get_width() // 2
+        base_y = self.display_surface.get_height() - 100
 
         for i, message in enumerate(reversed(self.messages)):
-    
-            image_type = message.get('image_type', 'status_scroll')  # Default to 'scroll' if not specified
-            if image_type not in self.popup_images:
+            if message['composed'] is None:
                 continue  # Skip messages with invalid image types
 
-            current_image = self.popup_images[image_type]
-            lines = message['text'].split('\n')
-            num_lines = len(lines)
-
-            current_y = base_y - (i * (message_spacing + (num_lines - 1) * line_spacing))
-
-            popup_rect = current_image.get_rect(center=(screen_width // 2, current_y))
-            self.display_surface.blit(current_image, popup_rect)
-
-            text_start_y = popup_rect.centery - ((num_lines - 1) * line_spacing) // 2
-
-            for j, line in enumerate(lines):
-                text_surface = self.font.render(line, True, (0, 0, 0))
-                text_rect = text_surface.get_rect(
-                    center=(popup_rect.centerx, 
-                           text_start_y + (j * line_spacing))
-                )
-                self.display_surface.blit(text_surface, text_rect)
\ No newline at end of file
+            surf, image_center, num_lines = message['composed']
+            current_y = base_y - (i * (self.message_spacing + (num_lines - 1) * self.line_spacing))
+            self.display_surface.blit(surf, (center_x - image_center[0], current_y - image_center[1]))
@@ -0,0 +1,116 @@
+from settings import *
+from array import array
+from time import perf_counter
+import csv
+import json
+
+PHASES = ('timers', 'update', 'collision', 'shop_input', 'popups_update', 'background', 'draw', 'popups_draw', 'hud', 'display_update')
+
+class PhaseProfiler:
+    # per-phase ring buffers of frame-phase times in ms, fed by begin()/lap() around each phase
+    def __init__(self, phases = PHASES, size = PROFILE_SAMPLES):
+        self.phases = phases
+        self.size = size
+        self.samples = {phase: array('d', bytes(8 * size)) for phase in phases}
+        self.counts = dict.fromkeys(phases, 0)
+        self.last = 0
+        self.used = False
+        self.kept = False # recording asked for up front, F3 only hides the overlay then
+
+        # overlay is rebuilt a few times a second, not every frame
+        self.show_overlay = False
+        self.overlay = None
+        self.overlay_time = 0
+        self.disable()
+
+    def enable(self, keep = False):
+        self.kept = self.kept or keep
+        self.enabled = self.used = True
+        self.begin = self._begin
+        self.lap = self._lap
+
+    def disable(self):
+        # hooks become no-ops, a disabled profiler only costs the call
+        self.enabled = False
+        self.begin = self.lap = self._off
+
+    def toggle(self):
+        # the overlay, and recording for it unless it was kept on from the start
+        self.show_overlay = not self.show_overlay
+        if self.show_overlay:
+            self.enable()
+        elif not self.kept:
+            self.disable()
+
+    def _off(self, phase = None):
+        pass
+
+    def _begin(self):
+        self.last = perf_counter()
+
+    def _lap(self, phase):
+        # time since the previous begin() or lap() is charged to phase
+        now = perf_counter()
+        count = self.counts[phase]
+        self.samples[phase][count % self.size] = (now - self.last) * 1000
+        self.counts[phase] = count + 1
+        self.last = now
+
+    def percentiles(self, phase, points = (50, 95, 99)):
+        filled = min(self.counts[phase], self.size)
+        if not filled:
+            return None
+        ordered = sorted(self.samples[phase][:filled])
+        return [ordered[min(filled - 1, filled * point // 100)] for point in points]
+
+    def report(self):
+        rows = []
+        for phase in self.phases:
+            values = self.percentiles(phase, (50, 95, 99, 100))
+            if values is None:
+                continue
+            filled = min(self.counts[phase], self.size)
+            rows.append({
+                'phase': phase,
+                'samples': self.counts[phase],
+                'mean_ms': round(sum(self.samples[phase][:filled]) / filled, 4),
+                'p50_ms': round(values[0], 4),
+                'p95_ms': round(values[1], 4),
+                'p99_ms': round(values[2], 4),
+                'max_ms': round(values[3], 4),
+            })
+        return rows
+
+    def dump(self, path = PROFILE_DUMP):
+        """Write the report to path.csv and path.json, skipped if profiling never ran"""
+        if not self.used:
+            return
+        rows = self.report()
+        with open(path + '.json', 'w') as file:
+            json.dump(rows, file, indent = 2)
+        with open(path + '.csv', 'w', newline = '') as file:
+            writer = csv.DictWriter(file, fieldnames = ('phase', 'samples', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'))
+            writer.writeheader()
+            writer.writerows(rows)
+
+    def draw_overlay(self, surface, font, counters = None):
+        # counters() returns {name: value} shown under the phases, only called when the overlay is rebuilt
+        if not self.show_overlay:
+            return
+        now = perf_counter()
+        if self.overlay is None or now - self.overlay_time > 0.25:
+            lines = [f'{"phase":<15}{"p50":>7}{"p95":>7}{"p99":>7}']
+            for phase in self.phases:
+                values = self.percentiles(phase)
+                if values:
+                    lines.append(f'{phase:<15}' + ''.join(f'{value:7.2f}' for value in values))
+            if counters:
+                lines.extend(f'{name:<15}{str(value):>21}' for name, value in counters().items())
+            line_height = font.get_linesize() + 4
+            texts = [font.render(line, True, (255, 255, 255)) for line in lines]
+            self.overlay = pygame.Surface((max(text.get_width() for text in texts) + 20, line_height * len(texts) + 20))
+            self.overlay.set_alpha(180)
+            for i, text in enumerate(texts):
+                self.overlay.blit(text, (10, 10 + i * line_height))
+            self.overlay_time = now
+        surface.blit(self.overlay, self.overlay.get_rect(topright = (surface.get_width() - 10, 10)))
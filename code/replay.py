@@ -0,0 +1,138 @@
+from settings import *
+from array import array
+from inputs import KeyState
+import json
+import struct
+import sys
+import zlib
+
+REPLAY_VERSION = 2
+REPLAY_MAGIC = b'PFRP'
+STREAMS = ('frame_times', 'frame_bits', 'checksums') # uint32 little-endian arrays after the header, in this order
+
+# keys read through input_source.get_pressed, then keys acted on when pressed (KEYDOWN)
+HELD_KEYS = (pygame.K_LEFT, pygame.K_RIGHT, pygame.K_a, pygame.K_d, pygame.K_SPACE, pygame.K_f, pygame.K_v,
+             pygame.K_e, pygame.K_ESCAPE, pygame.K_RETURN, pygame.K_c, pygame.K_LCTRL)
+PRESS_KEYS = (pygame.K_p, pygame.K_RETURN, pygame.K_COMMA, pygame.K_1, pygame.K_2, pygame.K_3, pygame.K_4, pygame.K_5)
+PRESS_SHIFT = 16
+SWAP_BIT = 1 << 30 # the level transition swapped the new level in this frame
+
+def pack_frame(keys, presses, swapped):
+    bits = 0
+    for i, key in enumerate(HELD_KEYS):
+        if keys[key]:
+            bits |= 1 << i
+    for i, key in enumerate(PRESS_KEYS):
+        if key in presses:
+            bits |= 1 << (PRESS_SHIFT + i)
+    return bits | (SWAP_BIT if swapped else 0)
+
+def run_length(values):
+    # [value, count, value, count, ...]
+    runs = array('I')
+    for value in values:
+        if runs and runs[-2] == value:
+            runs[-1] += 1
+        else:
+            runs.extend((value, 1))
+    return runs
+
+def expand(runs):
+    values = array('I')
+    for i in range(0, len(runs), 2):
+        values.extend([runs[i]] * runs[i + 1])
+    return values
+
+def little_endian(values):
+    # streams are stored little-endian whatever the machine, swapping is its own inverse
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+class Recorder:
+    # per-frame input of a live session: the frame time in ms and a bitfield of held keys,
+    # key presses and level swaps, plus a checksum of the game state every REPLAY_CHECKSUM frames
+    def __init__(self, seed, level, ticks):
+        self.header = {'version': REPLAY_VERSION, 'seed': seed, 'level': level, 'ticks': ticks}
+        self.frame_times = array('I')
+        self.frame_bits = array('I')
+        self.checksums = []
+
+    def __len__(self):
+        return len(self.frame_bits)
+
+    def record(self, dt_ms, keys, presses, swapped, checksum):
+        self.frame_times.append(dt_ms)
+        self.frame_bits.append(pack_frame(keys, presses, swapped))
+        if len(self) % REPLAY_CHECKSUM == 0:
+            self.checksums.append(checksum())
+
+    def save(self, path):
+        # frame times jitter around the frame cap and bits change a few times a second,
+        # run-length streams under zlib keep an hour of play in the kilobytes
+        # a flat layout: magic, header length, a JSON header, then the uint32 streams it gives the lengths of.
+        # Replays are shared as workloads, so loading one only ever parses data
+        streams = {'frame_times': run_length(self.frame_times), 'frame_bits': run_length(self.frame_bits),
+                   'checksums': array('I', self.checksums)}
+        header = json.dumps(dict(self.header, frames = len(self), **{name: len(streams[name]) for name in STREAMS})).encode()
+        body = b''.join(little_endian(streams[name]).tobytes() for name in STREAMS)
+        packed = zlib.compress(REPLAY_MAGIC + struct.pack('<I', len(header)) + header + body, 9)
+        with open(path, 'wb') as file:
+            file.write(packed)
+        return len(packed)
+
+class ReplayInput:
+    # plays a recording back as the game's input source, one recorded frame per advance
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            data = zlib.decompress(file.read())
+        if data[:4] != REPLAY_MAGIC:
+            raise ValueError(f'{path}: not a replay file')
+        (size,) = struct.unpack_from('<I', data, 4)
+        header = json.loads(data[8:8 + size])
+        if header['version'] != REPLAY_VERSION:
+            raise ValueError(f'{path}: replay version {header["version"]}, expected {REPLAY_VERSION}')
+        self.seed, self.level, self.ticks = header['seed'], header['level'], header['ticks']
+        streams, offset = {}, 8 + size
+        for name in STREAMS:
+            end = offset + 4 * header[name]
+            if end > len(data):
+                raise ValueError(f'{path}: truncated {name} stream')
+            streams[name] = little_endian(array('I', data[offset:end]))
+            offset = end
+        self.frame_times = expand(streams['frame_times'])
+        self.frame_bits = expand(streams['frame_bits'])
+        self.checksums = list(streams['checksums'])
+        self.frame = 0
+        self.dt_ms, self.presses, self.swapped = 0, set(), False
+        self.state = KeyState()
+        self.divergence = None # first frame whose checksum didn't match the recording
+
+    def __len__(self):
+        return len(self.frame_bits)
+
+    def advance(self):
+        bits = self.frame_bits[self.frame]
+        self.dt_ms = self.frame_times[self.frame]
+        self.state = KeyState(key for i, key in enumerate(HELD_KEYS) if bits & 1 << i)
+        self.presses = {key for i, key in enumerate(PRESS_KEYS) if bits & 1 << (PRESS_SHIFT + i)}
+        self.swapped = bool(bits & SWAP_BIT)
+        self.frame += 1
+
+    def get_pressed(self):
+        return self.state
+
+    @property
+    def done(self):
+        return self.frame >= len(self)
+
+    def verify(self, checksum):
+        """Compare the game state after the current frame against the recording, when it has a checksum for it"""
+        if self.frame % REPLAY_CHECKSUM:
+            return True
+        index = self.frame // REPLAY_CHECKSUM - 1
+        if index < len(self.checksums) and self.checksums[index] != checksum():
+            if self.divergence is None:
+                self.divergence = self.frame
+            return False
+        return True
@@ -0,0 +1,63 @@
+from settings import *
+
+class ScreenUpdates:
+    # which parts of the display changed this frame; static screens (menu, pause, game over,
+    # transition) draw once when entered and afterwards only hand over the rects they touched
+    def __init__(self, surface, enabled = DIRTY_RECTS):
+        self.surface = surface
+        self.enabled = enabled
+        self.state = None
+        self.stale = True
+        self.full = True
+        self.rects = []
+        self.frozen = None
+        self.texts = {}
+        self.overlays = {}
+
+    def begin(self, state, static = True):
+        """Start a frame in state, True when its screen has to be drawn from scratch"""
+        if state != self.state:
+            self.frozen = None
+        redraw = self.stale or state != self.state or not (static and self.enabled)
+        self.state = state
+        self.stale = False
+        self.full = self.full or redraw
+        return redraw
+
+    def invalidate(self):
+        # next begin redraws everything, the frozen backdrop is kept
+        self.stale = True
+
+    def mark(self, rect):
+        self.rects.append(pygame.Rect(rect))
+
+    def present(self):
+        if self.full:
+            pygame.display.update()
+        elif self.rects:
+            pygame.display.update(self.rects)
+        self.full = False
+        self.rects = []
+
+    def backdrop(self):
+        """The display as it was when the current state was entered, for screens drawn over the last game frame"""
+        if self.frozen is None:
+            self.frozen = self.surface.copy()
+        return self.frozen
+
+    def text(self, font, string, color):
+        key = (font, string, color)
+        if key not in self.texts:
+            if len(self.texts) > 64: # scores and percentages change, don't keep every one
+                self.texts.clear()
+            self.texts[key] = font.render(string, True, color)
+        return self.texts[key]
+
+    def overlay(self, size, color, alpha):
+        key = (size, color)
+        if key not in self.overlays:
+            self.overlays[key] = pygame.Surface(size)
+            self.overlays[key].fill(color)
+        surf = self.overlays[key]
+        surf.set_alpha(alpha)
+        return surf
@@ -5,7 +5,35 @@ from pytmx.util_pygame import load_pygame
 
 WINDOW_WIDTH, WINDOW_HEIGHT = 1600,900
 TILE_SIZE = 64 
+CHUNK_SIZE = 4 # tiles per side of a pre-baked static chunk
+CULL_BUCKET_SIZE = 256 # px per side of a culling bucket
+CULL_MARGIN = 128 # px drawn beyond the window edge
 FRAMERATE = 60
+IDLE_FRAMERATE = 30 # menus and overlays that only redraw on input don't need more
+DIRTY_RECTS = True # static screens draw once and push only changed rects to the display
+PHYSICS_RATE = 120 # fixed simulation steps per second, independent of FRAMERATE
+PHYSICS_DT = 1 / PHYSICS_RATE
+MAX_PHYSICS_STEPS = 8 # catch-up steps per rendered frame before the backlog is dropped
+INTERPOLATION_SNAP = 128 # px moved in one step past which a sprite is drawn unblended (teleports)
+PROFILE_SAMPLES = 600 # ring buffer length per profiled phase
+PROFILE_DUMP = 'profile' # --profile writes profile.csv and profile.json here on exit
+PLAYER_SPEED = 400 # px/s
+GRAVITY = 3000 # px/s^2
+JUMP_SPEED = 1200 # px/s
+NAV_CACHE_GOALS = 32 # goals whose shortest routes a level's navigation graph keeps
+BATCHED_KINEMATICS = True # bees, worms and bullets move as NumPy arrays instead of per-sprite updates
+POOL_SIZES = {'bullet': 32, 'fire': 8, 'bee': 64} # idle sprites kept per pool
+DESPAWN_MARGIN = 256 # px past the level edges at which bees and bullets are dropped
+DESPAWN_DISTANCES = {'bullet': WINDOW_WIDTH} # px from the player past which a tracked kind is dropped
+POPULATION_CAPS = {'bee': 40} # most live entities of a kind, spawners skip a spawn at the cap
+LIFECYCLE_SWEEP = 500 # ms between distance sweeps and population samples
+LIFECYCLE_SAMPLES = 240 # population samples kept for the report and the leak check
+REPLAY_CHECKSUM = 60 # frames between recorded game state checksums
+PARALLAX = True # scenery layers scroll behind each level, False keeps the flat BG_COLOR
+BACKGROUND_BUDGET = 3.0 # times the cost of the flat BG_COLOR fill the parallax background may average before it sheds an optional layer
+BACKGROUND_SAMPLES = 120 # draws averaged against the budget
+BACKGROUND_WARMUP = 30 # draws after a level swap or a shed/restore left out of the average while caches warm
+ASSET_BUDGET = 256 * 1024 * 1024 # bytes of per-level assets (tiles, baked chunks, frame sets) kept warm
 BG_COLOR = '#ffb9b3'
 BG_WHITE = '#FFFFFF'
 
@@ -1,47 +1,69 @@
 from settings import *
-from timer import Timer
+from timer import Timer, get_ticks, scheduler
+from kinematics import BULLET, BEE, WORM
 import pygame
 import sys
 from math import sin
-from random import randint
 
 class Sprite(pygame.sprite.Sprite):
+    pool = None # set by pools.SpritePool for recycled sprites
+    bodies = None # set by kinematics.KinematicBodies while batched
+
     def __init__(self, pos, surf, groups):
         super().__init__(groups)
         self.image = surf
         self.rect = self.image.get_frect(topleft = pos)
 
+    def kill(self):
+        # pooled sprites go back to their pool once they have left every group
+        alive = self.alive()
+        super().kill()
+        if alive and self.pool is not None:
+            self.pool.release(self)
+
 class Bullet(Sprite):
-    def __init__(self, surf, pos, direction, groups, bounds):
-        super().__init__(pos, surf, groups)
+    def __init__(self, frames, pos, direction, groups, bounds):
+        super().__init__(pos, frames.get(0, direction == -1), groups)
+        self.speed = 850
+        self.reset(frames, pos, direction, bounds)
 
-        self.image = pygame.transform.flip(self.image, direction == -1, False)
+    def reset(self, frames, pos, direction, bounds):
+        self.image = frames.get(0, direction == -1)
+        self.rect = self.image.get_frect(topleft = pos)
+        self.mask = frames.get_mask(0, direction == -1)
 
         # movement
         self.direction = direction
-        self.speed = 850
         self.bounds = bounds
 
+    def body_fields(self):
+        return {'kind': BULLET, 'vx': self.direction * self.speed, 'left': self.bounds.left, 'right': self.bounds.right}
+
     def update(self, dt):
         self.rect.x += self.direction * self.speed * dt
-        if self.rect.x < -1000 or self.rect.x > self.bounds + 1000:
+        if self.rect.right < self.bounds.left or self.rect.left > self.bounds.right:
             self.kill()
         
 class Fire(Sprite):
-    def __init__(self, surf, pos, groups, player):
-        super().__init__(pos, surf, groups)
+    def __init__(self, frames, pos, groups, player):
+        super().__init__(pos, frames.get(0, player.flip), groups)
+        self.timer = Timer(100, func = self.kill)
+        self.y_offset = pygame.Vector2(0,8)
+        self.reset(frames, pos, player)
+
+    def reset(self, frames, pos, player):
+        self.image = frames.get(0, player.flip)
+        self.rect = self.image.get_frect(topleft = pos)
+        self.mask = frames.get_mask(0, player.flip)
         self.player = player
         self.flip = player.flip
-        self.timer = Timer(100, autostart = True, func = self.kill)
-        self.y_offset = pygame.Vector2(0,8)
+        self.timer.activate()
         if self.player.flip:
             self.rect.midright = self.player.rect.midleft + self.y_offset
-            self.image = pygame.transform.flip(self.image, True, False)
         else:
             self.rect.midleft = self.player.rect.midright + self.y_offset
 
     def update(self, _):
-        self.timer.update()
         if self.player.flip:
             self.rect.midright = self.player.rect.midleft + self.y_offset
             
@@ -53,12 +75,21 @@ class Fire(Sprite):
 
 class AnimatedSprite(Sprite):
     def __init__(self, frames, pos, groups):
+        # frames is a support.FrameSet, both facings are pre-flipped
         self.frames, self.frame_index, self.animation_speed = frames, 0, 10
-        super().__init__(pos, self.frames[self.frame_index], groups)
+        self.flip = False
+        super().__init__(pos, self.frames.get(self.frame_index, self.flip), groups)
+        self.set_frame(self.frame_index, self.flip)
+
+    def set_frame(self, index, flip):
+        # image and mask always come from the same cached frame
+        self.frame = (int(index), flip)
+        self.image = self.frames.get(index, flip)
+        self.mask = self.frames.get_mask(index, flip)
     
     def animate(self, dt):
         self.frame_index += self.animation_speed * dt
-        self.image = self.frames[int(self.frame_index) % len(self.frames)]
+        self.set_frame(self.frame_index, self.flip)
 
 class Cherry(Sprite):
     def __init__(self, pos, surf, groups):
@@ -67,12 +98,21 @@ class Cherry(Sprite):
         self.rect = self.image.get_rect(topleft = pos)
 
 class Collectible(AnimatedSprite):
+    # never moves, so AllSprites skips it every step and only animates it when it is drawn
+    idle = True
+
     def __init__(self, frames, pos, groups):
         super().__init__(frames, pos, groups)
+        self.born = scheduler.now
         
     def update(self, dt):
         self.animate(dt / 2)
 
+    def animate_idle(self):
+        # the frame update() would have reached by now, on the game clock so it stops while paused
+        self.frame_index = (scheduler.now - self.born) / 1000 * self.animation_speed / 2
+        self.set_frame(self.frame_index, self.flip)
+
 class Coin(Collectible):
     def __init__(self, frames, rect, groups):
         super().__init__(frames, rect.topleft, groups)
@@ -98,7 +138,6 @@ class Enemy(AnimatedSprite):
         self.is_dying = False
 
     def update(self, dt):
-        self.death_timer.update()
         if not self.death_timer:
             self.move(dt)
             self.animate(dt)
@@ -108,46 +147,69 @@ class Enemy(AnimatedSprite):
         self.death_timer.activate()
         self.is_dying = True
         self.animation_speed = 0
-        self.image = pygame.mask.from_surface(self.image).to_surface()
-        self.image.set_colorkey('black')
+        self.image = self.frames.get_silhouette(*self.frame)
+        if self.bodies:
+            self.bodies.freeze(self)
         
 class Bee(Enemy):
-    def __init__(self,frames, pos, groups, speed):
+    def __init__(self,frames, pos, groups, speed, bounds, rng):
         super().__init__(frames, pos, groups)
+        self.reset(frames, pos, speed, bounds, rng)
+
+    def reset(self, frames, pos, speed, bounds, rng):
+        # back to a fresh, living bee
+        self.death_timer.deactivate()
+        self.is_dying = False
+        self.frames = frames
+        self.frame_index, self.animation_speed, self.flip = 0, 10, False
+        self.set_frame(self.frame_index, self.flip)
+        self.rect = self.image.get_frect(topleft = pos)
         self.speed = speed
-        self.amplitude = randint(400, 600)
-        self.frequency = randint(300, 600)
+        self.bounds = bounds # world rect, leaving it despawns the bee
+        self.amplitude = rng.randint(400, 600)
+        self.frequency = rng.randint(300, 600)
+
+    def body_fields(self):
+        return {'kind': BEE, 'vx': -self.speed, 'animation_speed': self.animation_speed,
+                'left': self.bounds.left, 'right': self.bounds.right}
 
     def move(self, dt):
         self.rect.x -= self.speed * dt
         # self.rect.y += sin(pygame.time.get_ticks() / self.frequency) * self.amplitude * dt
 
     def constraint(self):
-        if self.rect.right == 0:
+        # a float rect almost never lands on an exact edge, so test for having passed it
+        if self.rect.right < self.bounds.left or self.rect.left > self.bounds.right:
             self.kill()
 
 class Worm(Enemy):
-    def __init__(self, frames, rect, groups):
+    def __init__(self, frames, rect, groups, rng):
         super().__init__(frames, rect.topleft, groups)
         self.rect.bottomleft = rect.bottomleft
         self.main_rect = rect
-        self.speed = randint(160, 200)
+        self.speed = rng.randint(160, 200)
         self.direction = 1
 
+    def body_fields(self):
+        return {'kind': WORM, 'vx': self.direction * self.speed, 'animation_speed': self.animation_speed,
+                'left': self.main_rect.left, 'right': self.main_rect.right,
+                'inside_y': self.main_rect.top <= self.rect.top and self.main_rect.bottom >= self.rect.bottom}
+
     def move(self, dt):
         self.rect.x += self.direction * self.speed * dt
 
     def constraint(self):
         if not self.main_rect.contains(self.rect):
             self.direction *= -1
-            self.frames = [pygame.transform.flip(surf, True, False) for surf in self.frames]
+            self.flip = not self.flip
 
 class Player(AnimatedSprite):
 
-    def __init__(self, pos, groups, collision_sprites, collectible_sprites, frames, create_bullet, top_portal, bottom_portal, top_portal_two, bottom_portal_two, display_surface):
+    def __init__(self, pos, groups, collision_grid, collectible_sprites, frames, create_bullet, top_portal, bottom_portal, top_portal_two, bottom_portal_two, display_surface, input_source):
         
         super().__init__(frames, pos, groups)
         self.display_surface = display_surface
+        self.input_source = input_source
 
         
         self.visual_rect = self.rect.copy()  # Store the full-size visual rectangle
@@ -167,10 +229,12 @@ class Player(AnimatedSprite):
         # Movement and collision
         self.flip = False # Image Flip
         self.direction = pygame.Vector2()
-        self.collision_sprites = collision_sprites
+        self.collision_grid = collision_grid
+        self.collision_grid.lift(self.rect)
         self.create_bullet = create_bullet
-        self.speed = 400
-        self.gravity = 50
+        self.speed = PLAYER_SPEED
+        self.gravity = GRAVITY
+        self.jump_speed = JUMP_SPEED
         self.cherries = 0
         self.health_pots = 0
         self.coins = 0
@@ -227,11 +291,11 @@ class Player(AnimatedSprite):
              self.health_bar_width + 2, self.health_bar_height + 2), 1)
 
     def input(self):
-        keys = pygame.key.get_pressed()
+        keys = self.input_source.get_pressed()
         self.direction.x = (int(keys[pygame.K_RIGHT] or keys[pygame.K_d]) - 
                    int(keys[pygame.K_LEFT] or keys[pygame.K_a]))
         if keys[pygame.K_SPACE] and self.on_floor:
-            self.direction.y = -20
+            self.direction.y = -self.jump_speed
         if keys[pygame.K_v]:
             self.use_health_potion()
         if keys[pygame.K_f] and not self.shoot_timer:
@@ -242,25 +306,24 @@ class Player(AnimatedSprite):
             self.running = False
 
     def collect_collectibles(self):
-        for collectible in self.collectible_sprites:
-            if self.rect.colliderect(collectible.rect):
-                if isinstance(collectible, Cherry):
-                    self.cherries += 1
-                    self.points += 1000
-                    self.health = 100
-                if isinstance(collectible, Health_Potion):
-                    self.health_pots += 1
-                    self.points += 1000
-                    if self.health < 100:
-                        self.health += 0
-                if isinstance(collectible, Diamond):
-                    self.diamonds += 1
-                    self.points += 10000
-                elif isinstance(collectible, Coin):
-                    self.coins += 1
-                    self.points += 500
-
-                collectible.kill()  # This removes the sprite from all groups
+        for collectible in self.collectible_sprites.colliding(self.rect):
+            if isinstance(collectible, Cherry):
+                self.cherries += 1
+                self.points += 1000
+                self.health = 100
+            if isinstance(collectible, Health_Potion):
+                self.health_pots += 1
+                self.points += 1000
+                if self.health < 100:
+                    self.health += 0
+            if isinstance(collectible, Diamond):
+                self.diamonds += 1
+                self.points += 10000
+            elif isinstance(collectible, Coin):
+                self.coins += 1
+                self.points += 500
+
+            collectible.kill()  # This removes the sprite from all groups
 
     def move(self, dt):
         # horizontal
@@ -271,7 +334,7 @@ class Player(AnimatedSprite):
         
         # vertical
         self.direction.y += self.gravity * dt
-        self.rect.y += self.direction.y
+        self.rect.y += self.direction.y * dt
         self.visual_rect.center = self.rect.center
         self.collision('vertical')
 
@@ -304,20 +367,19 @@ class Player(AnimatedSprite):
                     return
             
 
-        for sprite in self.collision_sprites:
-            if sprite.rect.colliderect(self.rect):
+        for tile_rect in self.collision_grid.rects_near(self.rect):
+            if tile_rect.colliderect(self.rect):
                 if direction == 'horizontal':
-                    if self.direction.x > 0: self.rect.right = sprite.rect.left
-                    if self.direction.x < 0: self.rect.left = sprite.rect.right
+                    if self.direction.x > 0: self.rect.right = tile_rect.left
+                    if self.direction.x < 0: self.rect.left = tile_rect.right
                 if direction == 'vertical':
-                    if self.direction.y > 0: self.rect.bottom = sprite.rect.top
-                    if self.direction.y < 0: self.rect.top = sprite.rect.bottom
+                    if self.direction.y > 0: self.rect.bottom = tile_rect.top
+                    if self.direction.y < 0: self.rect.top = tile_rect.bottom
                     self.direction.y = 0
 
     def check_floor(self):
         bottom_rect = pygame.FRect((0,0), (self.rect.width, 2)).move_to(midtop = self.rect.midbottom)
-        level_rects = [sprite.rect for sprite in self.collision_sprites]
-        self.on_floor = True if bottom_rect.collidelist(level_rects) >= 0 else False
+        self.on_floor = self.collision_grid.collides(bottom_rect)
 
     def animate(self, dt):
         if self.direction.x:
@@ -326,8 +388,7 @@ class Player(AnimatedSprite):
         else:
             self.frame_index = 0
         self.frame_index = 1 if not self.on_floor else self.frame_index
-        self.image = self.frames[int(self.frame_index) % len(self.frames)]
-        self.image = pygame.transform.flip(self.image, self.flip, False)
+        self.set_frame(self.frame_index, self.flip)
         self.visual_rect.size = self.image.get_size()
         self.visual_rect.center = self.rect.center
 
@@ -351,12 +412,6 @@ class Player(AnimatedSprite):
     def update(self, dt):
         self.points_over_time()
         self.heal_over_time()
-        self.health_potion_cooldown.update()
-        self.teleport_timer.update()
-        self.points_tick_timer.update()
-        self.health_regen_timer.update()   
-        self.damaged_buffer_timer.update()
-        self.shoot_timer.update()
         self.check_floor()
         self.input()
         self.move(dt)
@@ -399,7 +454,7 @@ class Shop:
             {
                 'name': 'Sell Diamond',
                 'price': 100,  # Price player gets for selling
-                'icon': self.game.diamond_frames[0],  # Using first frame of diamond animation
+                'icon': self.game.atlas.image('diamond'),  # Using first frame of diamond animation
                 'type': 'sell'
             }
         ]
@@ -407,6 +462,6 @@ class Shop:
         
         # Update dialogue state
         if self.in_dialogue:
-            current_time = pygame.time.get_ticks()
+            current_time = get_ticks()
             if current_time - self.dialogue_start_time > self.dialogue_duration:
                 self.in_dialogue = False
\ No newline at end of file
@@ -22,4 +22,40 @@ def audio_importer(*path):
         for file_name in file_names:
             full_path = join(folder_path, file_name)
             audio_dict[file_name.split('.')[0]] = pygame.mixer.Sound(full_path)
-    return audio_dict
\ No newline at end of file
+    return audio_dict
+
+class FrameSet:
+    # every frame of an animation in both facings, flipped once at load time,
+    # with the collision mask and death silhouette of each frame
+    def __init__(self, frames):
+        self.facings = {
+            False: list(frames),
+            True: [pygame.transform.flip(frame, True, False) for frame in frames]
+        }
+        self.masks = {flip: [pygame.mask.from_surface(frame) for frame in frames] for flip, frames in self.facings.items()}
+        self.silhouettes = {}
+        for flip, masks in self.masks.items():
+            self.silhouettes[flip] = [mask.to_surface() for mask in masks]
+            for surf in self.silhouettes[flip]:
+                surf.set_colorkey('black')
+
+    def __len__(self):
+        return len(self.facings[False])
+
+    def __getitem__(self, index):
+        return self.facings[False][index]
+
+    def get(self, index, flip = False):
+        frames = self.facings[flip]
+        return frames[int(index) % len(frames)]
+
+    def get_mask(self, index, flip = False):
+        masks = self.masks[flip]
+        return masks[int(index) % len(masks)]
+
+    def get_silhouette(self, index, flip = False):
+        silhouettes = self.silhouettes[flip]
+        return silhouettes[int(index) % len(silhouettes)]
+
+def import_frame_set(*path):
+    return FrameSet(import_folder(*path))
@@ -1,12 +1,60 @@
 from settings import *
+from heapq import heappush, heappop
+from itertools import count
+
+# every timer reads the same clock, a headless game swaps in its simulated one
+time_source = pygame.time.get_ticks
+
+def get_ticks():
+    return time_source()
+
+def set_time_source(source):
+    global time_source
+    time_source = source
+
+class Scheduler:
+    # min-heap of timer deadlines on a game clock that reads the real clock once per tick;
+    # the game clock stops while paused and runs at time_scale otherwise
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.now = 0
+        self.last_ticks = get_ticks()
+        self.paused = False
+        self.time_scale = 1
+        self.deadlines = [] # (deadline, order, timer, generation), stale generations are skipped
+        self.order = count()
+        self.fired = 0
+
+    def schedule(self, timer):
+        heappush(self.deadlines, (timer.deadline, next(self.order), timer, timer.generation))
+
+    def tick(self):
+        ticks = get_ticks()
+        if not self.paused:
+            self.now += (ticks - self.last_ticks) * self.time_scale
+        self.last_ticks = ticks
+
+        deadlines = self.deadlines
+        while deadlines and deadlines[0][0] <= self.now:
+            _, _, timer, generation = heappop(deadlines)
+            if timer.active and timer.generation == generation:
+                self.fired += 1
+                timer.expire()
+
+scheduler = Scheduler()
 
 class Timer:
-    def __init__(self, duration, func = None, repeat = None, autostart = False):
+    def __init__(self, duration, func = None, repeat = None, autostart = False, scheduler = scheduler):
         self.duration = duration
         self.start_time = 0
         self.active = False
         self.func = func
         self.repeat = repeat
+        self.scheduler = scheduler
+        self.deadline = 0
+        self.generation = 0
 
         if autostart:
             self.activate()
@@ -16,17 +64,32 @@ class Timer:
 
     def activate(self):
         self.active = True
-        self.start_time = pygame.time.get_ticks()
+        self.start_time = self.scheduler.now
+        self.deadline = self.start_time + self.duration
+        self.generation += 1 # drops any deadline still queued from an earlier activation
+        self.scheduler.schedule(self)
         #print("activated timer")
 
     def deactivate(self):
         self.active = False
         self.start_time = 0
+        self.generation += 1
         if self.repeat:
             self.activate()
 
+    def cancel(self):
+        # stop without repeating, for timers whose owner is being thrown away
+        self.active = False
+        self.start_time = 0
+        self.generation += 1
+
+    def expire(self):
+        if self.func:
+            self.func()
+        # func may have restarted the timer, then this deadline is no longer its own
+        if self.active and self.deadline <= self.scheduler.now:
+            self.deactivate()
+
     def update(self):
-        if pygame.time.get_ticks() - self.start_time >= self.duration:
-            if self.func and self.start_time != 0: #make sure it doesnt instant trigger
-                self.func()
-            self.deactivate()
\ No newline at end of file
+        # kept for compatibility, the scheduler flips timers when their deadline passes
+        pass